@@ -0,0 +1,245 @@
+# benchmarks/run.py — time ETL transforms, upserts and dashboard queries at N× scale
+#
+#   python benchmarks/run.py                          # scales 1,10,100 → benchmarks/results/<ts>.json
+#   python benchmarks/run.py --scales 1,10,100,1000 --only bls_parse,stocks_transform
+#   python benchmarks/run.py --baseline benchmarks/results/main.json --max-regression 1.25
+#
+# DB benchmarks run only when BENCH_DATABASE_URL points at a scratch PostgreSQL; they work
+# in a throwaway schema and drop it afterwards.
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import tempfile
+import argparse
+import platform
+import statistics
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(ROOT / "etl"), str(ROOT / "dashboard"), str(Path(__file__).resolve().parent)]
+
+import synthetic  # noqa: E402
+import bls_ces_ingest  # noqa: E402
+import stocks_ingest  # noqa: E402
+import datalayer  # noqa: E402
+import analytics  # noqa: E402
+import downsample  # noqa: E402
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# ---------------- Benchmarks ----------------
+# Each takes (scale, ctx) and returns (callable to time, rows processed per call).
+
+def bench_bls_parse(scale, ctx):
+    payload = synthetic.bls_payload(scale)
+    rows = sum(len(s["data"]) for s in payload)
+    return (lambda: bls_ces_ingest.to_frame(payload)), rows
+
+def bench_stocks_transform(scale, ctx):
+    data = synthetic.price_frame(scale)
+    tickers = list(data["Close"].columns)
+    return (lambda: stocks_ingest.add_returns(stocks_ingest.to_monthly(stocks_ingest.to_daily(data, tickers)))), data.size
+
+def bench_dashboard_slice(scale, ctx):
+    # One interaction: window + ETF selection + correlation snapshot, all in memory
+    d = synthetic.dashboard_frames(scale)
+    t0, t1 = list(d["equities"]["ticker"].cat.categories[:2])
+    def run():
+        eq = datalayer.window(d["equities"], "2010-01-01", "2020-12-01")
+        eq[eq["ticker"].isin([t0, t1])]
+        return datalayer.corr_snapshot(d, t0, t1, "2010-01-01", "2020-12-01")
+    return run, len(d["equities"])
+
+def bench_correlation_cube(scale, ctx):
+    d = synthetic.dashboard_frames(scale)
+    pair = (d["equities"]["ticker"].cat.categories[0], d["sectors"]["sector_name"].cat.categories[0])
+    return (lambda: analytics.correlation_report(d, max_lag=6, pair=pair)), len(d["equities"])
+
+def bench_chart_downsample(scale, ctx):
+    # Daily closes of two tickers (the dashboard's daily chart) cut to CHART_MAX_POINTS per line;
+    # scale stretches the history so the drawn point count stays fixed while the input grows
+    data = synthetic.price_frame(1)
+    tickers = list(data["Close"].columns[:2])
+    daily = stocks_ingest.to_daily(data, tickers)
+    daily = daily[daily["ticker"].isin(tickers)]
+    reps = [daily.assign(period_date=daily["period_date"] + pd.DateOffset(years=30 * k)) for k in range(scale)]
+    daily = pd.concat(reps, ignore_index=True)
+    return (lambda: downsample.downsample(daily, "period_date", "adj_close", by="ticker")), len(daily)
+
+def bench_forecast_fit(scale, ctx):
+    # Refit of every synthetic sector series (AIC order search + bootstrap intervals), inline:
+    # the per-series cost the forecast stage spreads over its process pool
+    import forecast
+    ces = synthetic.monthly_frames(scale)["employment_sector"]
+    tasks = [forecast._task({"key": f"ces:{code}", "y": g["employment_thousands"].to_numpy(), "log": True}, None)
+             for code, g in ces.groupby("sector_code")]
+    return (lambda: forecast.run_tasks(tasks, workers=1)), len(ces)
+
+def _load_scale(engine, frames):
+    from common import upsert
+    with engine.begin() as c:
+        c.exec_driver_sql("truncate equities_monthly, unemployment_headline, employment_sector")
+    upsert(engine, "equities_monthly", frames["equities_monthly"], ["period_date", "ticker"])
+    upsert(engine, "unemployment_headline", frames["unemployment_headline"], ["period_date"])
+    upsert(engine, "employment_sector", frames["employment_sector"], ["period_date", "sector_code"])
+
+def bench_upsert(scale, ctx):
+    frames = synthetic.monthly_frames(scale)
+    return (lambda: _load_scale(ctx["engine"], frames)), sum(len(f) for f in frames.values())
+
+def bench_dashboard_sql(scale, ctx):
+    # Rollup refresh after a load + the dashboard's bulk read of every rollup
+    from rollups import refresh_rollups
+    from sqlalchemy import text
+    engine = ctx["engine"]
+    def q(sql):
+        with engine.connect() as c:
+            return pd.read_sql(text(sql), c)
+    def run():
+        refresh_rollups(engine, changed=True)
+        return datalayer.load_all(q)
+    frames = synthetic.monthly_frames(scale)
+    _load_scale(engine, frames)
+    return run, sum(len(f) for f in frames.values())
+
+def bench_dashboard_duckdb(scale, ctx):
+    # Same path on the embedded backend, no server needed: the DuckDB load (views over the
+    # Parquet datasets + rollup tables) and the dashboard's bulk read of every rollup
+    import pyarrow.parquet as pq
+    import backend
+    from store import _to_table
+    tmp = Path(tempfile.mkdtemp(prefix="bench_duckdb_"))
+    atexit.register(shutil.rmtree, tmp, True)
+    frames = synthetic.monthly_frames(scale)
+    for table, df in frames.items():
+        dataset = backend.DUCK_VIEWS[table]
+        pq.write_to_dataset(_to_table(dataset, df), tmp / dataset, partition_cols=["year"])
+    path = tmp / "warehouse.duckdb"
+    def run():
+        backend.load_duckdb(path, data_dir=tmp)
+        return datalayer.load_all(lambda sql: backend.duck_query(sql, path=path))
+    return run, sum(len(f) for f in frames.values())
+
+BENCHMARKS = {
+    "bls_parse": (bench_bls_parse, False),
+    "stocks_transform": (bench_stocks_transform, False),
+    "dashboard_slice": (bench_dashboard_slice, False),
+    "correlation_cube": (bench_correlation_cube, False),
+    "chart_downsample": (bench_chart_downsample, False),
+    "forecast_fit": (bench_forecast_fit, False),
+    "upsert": (bench_upsert, True),            # needs BENCH_DATABASE_URL
+    "dashboard_sql": (bench_dashboard_sql, True),
+    "dashboard_duckdb": (bench_dashboard_duckdb, False),
+}
+
+# ---------------- Runner ----------------
+
+def _db_context():
+    url = os.getenv("BENCH_DATABASE_URL", "").strip()
+    if not url:
+        return None
+    from sqlalchemy import create_engine
+    from schema import migrate
+    bench_schema = f"bench_{os.getpid()}"
+    admin = create_engine(url)
+    with admin.begin() as c:
+        c.exec_driver_sql(f"create schema {bench_schema}")
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={bench_schema}"})
+    migrate(engine)
+    return {"engine": engine, "admin": admin, "schema": bench_schema}
+
+def _time(fn, repeat: int) -> list[float]:
+    fn()  # warm-up (imports, caches, first-touch allocations)
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+def run(names, scales, repeat) -> list[dict]:
+    ctx = None
+    if any(BENCHMARKS[n][1] for n in names):
+        ctx = _db_context()
+        if ctx is None:
+            print("BENCH_DATABASE_URL not set; skipping DB benchmarks")
+    results = []
+    try:
+        for name in names:
+            setup, needs_db = BENCHMARKS[name]
+            if needs_db and ctx is None:
+                continue
+            for scale in scales:
+                fn, rows = setup(scale, ctx)
+                times = _time(fn, repeat)
+                best = min(times)
+                results.append({
+                    "bench": name, "scale": scale, "rows": int(rows),
+                    "min_s": round(best, 6), "median_s": round(statistics.median(times), 6),
+                    "rows_per_s": round(rows / best) if best else None,
+                })
+                print(f"{name:<18} {scale:>5}×  {rows:>12,} rows  min {best * 1000:10.2f} ms")
+    finally:
+        if ctx:
+            ctx["engine"].dispose()
+            with ctx["admin"].begin() as c:
+                c.exec_driver_sql(f"drop schema {ctx['schema']} cascade")
+    return results
+
+def compare(results, baseline_path, max_regression) -> list[str]:
+    base = {(r["bench"], r["scale"]): r for r in json.loads(Path(baseline_path).read_text())["results"]}
+    failures = []
+    for r in results:
+        b = base.get((r["bench"], r["scale"]))
+        if not b or not b["min_s"]:
+            continue
+        ratio = r["min_s"] / b["min_s"]
+        flag = "REGRESSION" if ratio > max_regression else "ok"
+        print(f"{r['bench']:<18} {r['scale']:>5}×  {ratio:6.2f}× baseline  {flag}")
+        if ratio > max_regression:
+            failures.append(f"{r['bench']}@{r['scale']}× is {ratio:.2f}× slower than baseline")
+    return failures
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Jobs vs Wall Street benchmark suite")
+    ap.add_argument("--scales", default="1,10,100", help="comma-separated multiples of today's data size")
+    ap.add_argument("--only", help=f"comma-separated benchmarks ({', '.join(BENCHMARKS)})")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", help="result JSON path (default benchmarks/results/<timestamp>.json)")
+    ap.add_argument("--baseline", help="previous result JSON to compare against")
+    ap.add_argument("--max-regression", type=float, default=1.25, help="fail if min time exceeds baseline × this")
+    args = ap.parse_args(argv)
+
+    names = [n.strip() for n in (args.only or ",".join(BENCHMARKS)).split(",") if n.strip()]
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        raise SystemExit(f"Unknown benchmark(s): {', '.join(unknown)}")
+    scales = [int(s) for s in args.scales.split(",")]
+
+    results = run(names, scales, args.repeat)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "versions": {"pandas": pd.__version__, "numpy": np.__version__},
+        "repeat": args.repeat,
+        "results": results,
+    }
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"Wrote {out}")
+
+    if args.baseline:
+        failures = compare(results, args.baseline, args.max_regression)
+        if failures:
+            print("\n".join(failures))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/synthetic.py — deterministic, production-shaped inputs at N× today's scale
+import numpy as np
+import pandas as pd
+
+# Today's universe: 15 CES supersectors + 1 headline series, 12 tickers, BLS history from 2000
+BASE_SERIES = 15
+BASE_TICKERS = 12
+START_YEAR, END_YEAR = 2000, 2025
+
+def _rng(seed: int, *salt: int) -> np.random.Generator:
+    return np.random.default_rng([seed, *salt])
+
+def series_ids(n: int) -> list[str]:
+    from bls_ces_ingest import CES_SUPERSECTORS
+    real = list(CES_SUPERSECTORS)
+    return real[:n] + [f"CES{i:08d}01" for i in range(n - len(real))]
+
+def bls_payload(scale: int = 1, seed: int = 0) -> list[dict]:
+    # Results.series as returned by BLS v2: newest first, M13 annual averages included,
+    # the latest two months flagged preliminary
+    rng = _rng(seed, scale)
+    years = range(END_YEAR, START_YEAR - 1, -1)
+    periods = [(y, f"M{m:02d}") for y in years for m in [13] + list(range(12, 0, -1))]
+    out = []
+    for sid in series_ids(BASE_SERIES * scale):
+        level = 1000 + rng.random() * 20000
+        vals = level * np.cumprod(1 + rng.normal(0, 0.002, len(periods)))
+        data = [{"year": str(y), "period": p, "value": f"{v:.1f}", "footnotes": [{}]}
+                for (y, p), v in zip(periods, vals)]
+        for d in data[1:3]:
+            d["footnotes"] = [{"code": "P", "text": "preliminary"}]
+        out.append({"seriesID": sid, "data": data})
+    return out
+
+def price_frame(scale: int = 1, seed: int = 0) -> pd.DataFrame:
+    # yf.download(..., auto_adjust=True) shape: business-day index, ("Close", ticker) columns
+    rng = _rng(seed, scale, 1)
+    days = pd.bdate_range(f"{START_YEAR - 1}-01-01", f"{END_YEAR}-12-31")
+    tickers = [f"T{i:05d}" for i in range(BASE_TICKERS * scale)]
+    px = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, (len(days), len(tickers))), axis=0))
+    # Late listings: leading NaNs like pre-inception ETFs
+    for j in range(0, len(tickers), 6):
+        px[: rng.integers(0, len(days) // 2), j] = np.nan
+    cols = pd.MultiIndex.from_product([["Close"], tickers])
+    return pd.DataFrame(px, index=days, columns=cols)
+
+def monthly_frames(scale: int = 1, seed: int = 0) -> dict[str, pd.DataFrame]:
+    # Base-table shaped frames (equities_monthly, unemployment_headline, employment_sector)
+    rng = _rng(seed, scale, 2)
+    months = pd.date_range(f"{START_YEAR}-01-01", f"{END_YEAR}-12-01", freq="MS")
+    tickers = [f"T{i:05d}" for i in range(BASE_TICKERS * scale)]
+    closes = 50 * np.exp(np.cumsum(rng.normal(0, 0.04, (len(months), len(tickers))), axis=0))
+    eq = pd.DataFrame({
+        "period_date": np.repeat(months + pd.offsets.MonthEnd(0), len(tickers)),
+        "ticker": np.tile(tickers, len(months)),
+        "adj_close": closes.ravel(),
+    })
+    eq["monthly_return"] = eq.groupby("ticker")["adj_close"].pct_change()
+    codes = series_ids(BASE_SERIES * scale)
+    emp = 1000 + 20000 * rng.random(len(codes)) * np.cumprod(1 + rng.normal(0, 0.002, (len(months), len(codes))), axis=0)
+    ces = pd.DataFrame({
+        "period_date": np.repeat(months, len(codes)),
+        "sector_code": np.tile(codes, len(months)),
+        "sector_name": np.tile([f"Sector {c}" for c in codes], len(months)),
+        "employment_thousands": emp.ravel(),
+    })
+    un = pd.DataFrame({"period_date": months, "unemployment_rate": 4 + np.abs(rng.normal(0, 1, len(months)))})
+    return {"equities_monthly": eq, "unemployment_headline": un, "employment_sector": ces}
+
+def dashboard_frames(scale: int = 1, seed: int = 0) -> dict[str, pd.DataFrame]:
+    # dashboard/datalayer.py shaped frames built from monthly_frames
+    base = monthly_frames(scale, seed)
+    eq = base["equities_monthly"].assign(ym=lambda d: d["period_date"].dt.to_period("M").dt.to_timestamp())
+    ces = base["employment_sector"].rename(columns={"period_date": "ym"}).sort_values(["sector_code", "ym"])
+    ces["emp_pct_change"] = ces.groupby("sector_code")["employment_thousands"].pct_change()
+    un = base["unemployment_headline"].rename(columns={"period_date": "ym"})
+    eq = eq[["ym", "ticker", "adj_close", "monthly_return"]]
+    for df, cols in ((eq, ["ticker"]), (ces, ["sector_code", "sector_name"])):
+        for c in cols:
+            df[c] = df[c].astype("category")
+    return {"unemployment": un, "equities": eq.reset_index(drop=True), "sectors": ces.reset_index(drop=True)}
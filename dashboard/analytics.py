@@ -0,0 +1,102 @@
+# dashboard/analytics.py — vectorized ETF × CES-sector correlation engine
+import numpy as np
+import pandas as pd
+
+ROLLING_WINDOWS = (12, 36, 60)
+
+def aligned_matrices(data: dict, start=None, end=None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # month × ticker returns and month × sector jobs Δ%, on one shared monthly index
+    eq, sec = data["equities"], data["sectors"]
+    rets = eq.pivot_table(index="ym", columns="ticker", values="monthly_return", observed=True)
+    jobs = sec.pivot_table(index="ym", columns="sector_name", values="emp_pct_change", observed=True)
+    rets.columns = rets.columns.astype(str)
+    jobs.columns = jobs.columns.astype(str)
+    months = rets.index.union(jobs.index)
+    if start is not None:
+        months = months[months >= pd.Timestamp(start)]
+    if end is not None:
+        months = months[months <= pd.Timestamp(end)]
+    return rets.reindex(months), jobs.reindex(months)
+
+def _pearson(n, sx, sy, sxx, syy, sxy, min_periods: int) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = n * sxy - sx * sy
+        var = (n * sxx - sx ** 2) * (n * syy - sy ** 2)
+        r = cov / np.sqrt(var)
+    r[(n < min_periods) | ~np.isfinite(r)] = np.nan
+    return np.clip(r, -1.0, 1.0)
+
+def corr_matrix(x: np.ndarray, y: np.ndarray, min_periods: int = 3) -> np.ndarray:
+    # Pairwise-complete Pearson of every column of x (T×A) with every column of y (T×B),
+    # as six matrix products instead of A·B separate correlations.
+    mx, my = ~np.isnan(x), ~np.isnan(y)
+    x0, y0 = np.where(mx, x, 0.0), np.where(my, y, 0.0)
+    mxf, myf = mx.astype(float), my.astype(float)
+    n = mxf.T @ myf
+    return _pearson(n, x0.T @ myf, mxf.T @ y0, (x0 ** 2).T @ myf, mxf.T @ (y0 ** 2), x0.T @ y0, min_periods)
+
+def _shift(a: np.ndarray, k: int) -> np.ndarray:
+    # out[t] = a[t + k], NaN-padded
+    out = np.full_like(a, np.nan)
+    if k >= 0:
+        out[:len(a) - k] = a[k:]
+    else:
+        out[-k:] = a[:len(a) + k]
+    return out
+
+def lead_lag(rets: pd.DataFrame, jobs: pd.DataFrame, max_lag: int = 6, min_periods: int = 12) -> np.ndarray:
+    # Cube [lag, ticker, sector] of corr(return_t, jobs_{t+lag}) for lag in -max_lag..max_lag;
+    # positive lags mean returns lead jobs. All lags go through one corr_matrix call.
+    lags = range(-max_lag, max_lag + 1)
+    y = jobs.to_numpy(float)
+    stacked = np.concatenate([_shift(y, k) for k in lags], axis=1)
+    r = corr_matrix(rets.to_numpy(float), stacked, min_periods)
+    return r.reshape(r.shape[0], len(lags), y.shape[1]).transpose(1, 0, 2)
+
+def rolling_corr(rets: pd.DataFrame, jobs: pd.DataFrame, window: int, min_periods: int | None = None) -> np.ndarray:
+    # Cube [month, ticker, sector] of trailing-window correlations via cumulative sums
+    x, y = rets.to_numpy(float), jobs.to_numpy(float)
+    mx, my = ~np.isnan(x), ~np.isnan(y)
+    x0, y0 = np.where(mx, x, 0.0), np.where(my, y, 0.0)
+    mxf, myf = mx.astype(float), my.astype(float)
+
+    def roll(a, b):
+        cs = np.cumsum(np.einsum("ta,tb->tab", a, b), axis=0)
+        cs[window:] = cs[window:] - cs[:-window]
+        return cs
+
+    n = roll(mxf, myf)
+    return _pearson(n, roll(x0, myf), roll(mxf, y0), roll(x0 ** 2, myf), roll(mxf, y0 ** 2), roll(x0, y0),
+                    min_periods or max(3, window // 2))
+
+def correlation_report(data: dict, start=None, end=None, max_lag: int = 6, pair: tuple | None = None) -> dict:
+    # pair=(ticker, sector) limits the rolling cubes to that pair: the full rolling cube is
+    # months × tickers × sectors per window and dominates the cost at larger universes
+    rets, jobs = aligned_matrices(data, start, end)
+    cube = lead_lag(rets, jobs, max_lag)
+    lags = np.arange(-max_lag, max_lag + 1)
+    # Best lag per pair by absolute correlation (NaN-safe)
+    filled = np.where(np.isnan(cube), -np.inf, np.abs(cube))
+    best = filled.argmax(axis=0)
+    best_r = np.take_along_axis(cube, best[None], axis=0)[0]
+
+    def frame(a):
+        return pd.DataFrame(a, index=rets.columns, columns=jobs.columns)
+
+    rx, ry = rets, jobs
+    if pair is not None:
+        rx = rets[[pair[0]]] if pair[0] in rets else rets.iloc[:, :0]
+        ry = jobs[[pair[1]]] if pair[1] in jobs else jobs.iloc[:, :0]
+    return {
+        "corr": frame(cube[max_lag]),
+        "lags": lags,
+        "lead_lag": cube,
+        "best_lag": frame(np.where(np.isnan(best_r), np.nan, lags[best])),
+        "best_corr": frame(best_r),
+        "rolling": {w: rolling_corr(rx, ry, w) for w in ROLLING_WINDOWS},
+        "rolling_tickers": list(rx.columns),
+        "rolling_sectors": list(ry.columns),
+        "months": rets.index,
+        "tickers": list(rets.columns),
+        "sectors": list(jobs.columns),
+    }
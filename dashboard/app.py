@@ -1,11 +1,21 @@
 # dashboard/app.py
 import os
+import sys
+import time
+from pathlib import Path
+from collections import deque
 import pandas as pd
 import plotly.express as px
 import streamlit as st
-from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 
+# Storage backend shared with the ETL (etl/backend.py): Postgres or an embedded DuckDB file
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+import backend  # noqa: E402
+import datalayer  # noqa: E402
+import analytics  # noqa: E402
+import downsample  # noqa: E402
+
 # ---------------- Setup ----------------
 st.set_page_config(page_title="Jobs vs Wall Street", layout="wide")
 st.markdown("""
@@ -16,34 +26,56 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 load_dotenv()
-REQ = ["PGHOST","PGPORT","PGDATABASE","PGUSER","PGPASSWORD"]
-for k in REQ:
-    if not os.getenv(k):
-        st.error(f"Missing .env variable: {k}")
-        st.stop()
-
-PGHOST=os.getenv("PGHOST").strip()
-PGPORT=os.getenv("PGPORT","5432").strip()
-PGDATABASE=os.getenv("PGDATABASE").strip()
-PGUSER=os.getenv("PGUSER").strip()
-PGPASSWORD=os.getenv("PGPASSWORD").strip()
+if not backend.configured():
+    st.error("No database configured: set DATABASE_URL or PGHOST/PGPORT/PGDATABASE/PGUSER/PGPASSWORD "
+             "in .env, or ETL_BACKEND=duckdb for the local DuckDB file.")
+    st.stop()
 
-ENGINE_URL = f"postgresql+psycopg2://{PGUSER}:{PGPASSWORD}@{PGHOST}:{PGPORT}/{PGDATABASE}?sslmode=require"
+# Debug panel (?debug=1 or DASHBOARD_DEBUG=1): per-query timings of recent q() calls
+DEBUG = os.getenv("DASHBOARD_DEBUG", "0") == "1" or st.query_params.get("debug") == "1"
+QUERY_LOG_SIZE = 500
 
 @st.cache_resource
-def get_engine():
-    return create_engine(ENGINE_URL, pool_pre_ping=True)
+def query_log() -> deque:
+    # Shared by all sessions; cached loaders call q() once per data version, not per rerun
+    return deque(maxlen=QUERY_LOG_SIZE)
 
-@st.cache_data(ttl=60*15)
 def q(sql: str, params: dict | None = None) -> pd.DataFrame:
-    with get_engine().connect() as c:
-        return pd.read_sql(text(sql), c, params=params or {})
+    t0 = time.perf_counter()
+    df = backend.query(sql, params)
+    query_log().append({
+        "at": time.strftime("%H:%M:%S"),
+        "ms": round((time.perf_counter() - t0) * 1000, 1),
+        "rows": len(df),
+        "sql": " ".join(sql.split()),
+    })
+    return df
+
+# etl/load_to_db.py bumps etl_data_version whenever a load changes rows. Polling that
+# one tiny row (at most every few seconds) decides when the cached dataset is stale.
+VERSION_POLL_SECONDS = 10
+
+@st.cache_data(ttl=VERSION_POLL_SECONDS)
+def data_version() -> str:
+    try:
+        v = q("select table_name, version from etl_data_version order by 1")
+    except Exception:
+        return "unversioned"  # loader has not run since versioning was added
+    return ",".join(f"{r.table_name}:{r.version}" for r in v.itertuples())
+
+# Whole dataset is a few thousand rows: load it once per data version, shared by all
+# sessions, and do every window / ETF / KPI computation in memory. Never mutate these frames.
+@st.cache_resource(max_entries=1)
+def load_data(version: str) -> dict[str, pd.DataFrame]:
+    return datalayer.load_all(q)
+
+D = load_data(data_version())
 
 st.title("Jobs vs Wall Street 📊")
 st.caption("U.S. unemployment & sector employment vs S&P 500 and sector ETFs — monthly aligned")
 
 # ---------------- Universe autodetect ----------------
-tickers = q("select distinct ticker from equities_monthly order by 1;")["ticker"].tolist()
+tickers = sorted(D["equities"]["ticker"].unique().tolist())
 if not tickers:
     st.error("No equities in DB. Load data first.")
     st.stop()
@@ -60,21 +92,9 @@ if not ETFS:
     st.stop()
 
 # Overall monthly overlap across tables
-meta = q("""
-    select 
-      (select min(date_trunc('month', period_date)) from equities_monthly)   as eq_min,
-      (select max(date_trunc('month', period_date)) from equities_monthly)   as eq_max,
-      (select min(date_trunc('month', period_date)) from unemployment_headline) as un_min,
-      (select max(date_trunc('month', period_date)) from unemployment_headline) as un_max,
-      (select min(date_trunc('month', period_date)) from employment_sector)  as ces_min,
-      (select max(date_trunc('month', period_date)) from employment_sector)  as ces_max
-""")
-eq_min = pd.to_datetime(meta.loc[0,"eq_min"]).date()
-eq_max = pd.to_datetime(meta.loc[0,"eq_max"]).date()
-un_min = pd.to_datetime(meta.loc[0,"un_min"]).date()
-un_max = pd.to_datetime(meta.loc[0,"un_max"]).date()
-ces_min = pd.to_datetime(meta.loc[0,"ces_min"]).date()
-ces_max = pd.to_datetime(meta.loc[0,"ces_max"]).date()
+eq_min, eq_max = datalayer.span(D["equities"])
+un_min, un_max = datalayer.span(D["unemployment"])
+ces_min, ces_max = datalayer.span(D["sectors"])
 
 start_default = max(eq_min, un_min, ces_min)
 end_default   = min(eq_max, un_max, ces_max)
@@ -93,6 +113,23 @@ ETF_TO_CES = {
     "XLC": "Information",
 }
 
+# Finer CES industries from the detailed catalog (etl/ces_catalog.py); each ETF falls back to
+# its supersector above until that industry has been loaded
+ETF_TO_INDUSTRY = {
+    "XLB": "Chemicals",
+    "XLE": "Oil and gas extraction",
+    "XLF": "Credit intermediation and related activities",
+    "XLI": "Machinery",
+    "XLK": "Computer systems design and related services",
+    "XLP": "Food manufacturing",
+    "XLU": "Utilities",
+    "XLV": "Health care",
+    "XLY": "Food services and drinking places",
+    "XLRE": "Real estate",
+    "XLC": "Telecommunications",
+}
+INDUSTRIES = set(D["industries"]["sector_name"].dropna().unique())
+
 # ---------------- Sidebar ----------------
 with st.sidebar:
     st.header("Controls")
@@ -102,41 +139,20 @@ with st.sidebar:
     default_idx = ETFS.index("XLK") if "XLK" in ETFS else 0
     sector_etf = st.selectbox("Sector ETF", ETFS, index=default_idx)
     sector_name = ETF_TO_CES.get(sector_etf, "Manufacturing")
-
-params = {"start": str(start), "end": str(end), "spx": SPX, "etf": sector_etf, "sector_name": sector_name}
+    industry = ETF_TO_INDUSTRY.get(sector_etf)
+    use_industry = industry in INDUSTRIES
+    jobs_name = industry if use_industry else sector_name
+    st.caption(f"Jobs series: {jobs_name}" + (" (detailed CES industry)" if use_industry else " (CES supersector)"))
 
 # ---------------- Monthly-aligned data ----------------
-unemp = q("""
-    select date_trunc('month', period_date)::date as ym,
-           avg(unemployment_rate) as unemployment_rate
-    from unemployment_headline
-    where period_date between :start and :end
-    group by 1
-    order by 1
-""", params)
-
-equities = q("""
-    select date_trunc('month', period_date)::date as ym,
-           ticker, 
-           max(adj_close) as adj_close,          -- end-of-month
-           avg(monthly_return) as monthly_return
-    from equities_monthly
-    where period_date between :start and :end
-      and ticker in (:spx, :etf)
-    group by 1,2
-    order by 1,2
-""", params)
-
-sector_jobs = q("""
-    select date_trunc('month', period_date)::date as ym,
-           sector_name,
-           avg(employment_thousands) as employment_thousands
-    from employment_sector
-    where period_date between :start and :end
-      and sector_name = :sector_name
-    group by 1,2
-    order by 1,2
-""", params)
+# In-memory slices of the month-keyed rollups (see etl/rollups.py); no DB round trips
+unemp = datalayer.window(D["unemployment"], start, end)
+
+equities = datalayer.window(D["equities"], start, end)
+equities = equities[equities["ticker"].isin([SPX, sector_etf])].sort_values(["ym", "ticker"])
+
+sector_jobs = datalayer.window(D["industries" if use_industry else "sectors"], start, end)
+sector_jobs = sector_jobs[sector_jobs["sector_name"] == jobs_name]
 
 def nonempty(df, name):
     if df.empty:
@@ -194,8 +210,7 @@ if ok_u and ok_e:
     r3_e  = pct_window(r_etf, 3)
     r12_e = pct_window(r_etf, 12)
 
-    sj = sector_jobs.sort_values("ym").copy()
-    sj["emp_pct_change"] = sj["employment_thousands"].pct_change()
+    sj = sector_jobs.sort_values("ym")
     corr_df = pd.merge(
         etf[["ym","monthly_return"]], sj[["ym","emp_pct_change"]],
         on="ym", how="inner"
@@ -241,7 +256,7 @@ if ok_s and ok_e:
             fig2 = px.line(
                 df_b, x="ym", y=["employment_thousands","etf_indexed"],
                 labels={"value":"Value","ym":"Month","variable":"Series"},
-                title=f"{sector_name} Jobs (k) vs {sector_etf} (indexed to 100; {start} → {end})"
+                title=f"{jobs_name} Jobs (k) vs {sector_etf} (indexed to 100; {start} → {end})"
             )
             col2.plotly_chart(fig2, use_container_width=True)
         else:
@@ -252,27 +267,128 @@ if ok_s and ok_e:
 # C) Correlation snapshot table (monthly)
 st.subheader("Correlation snapshot (monthly)")
 if ok_u and ok_e:
-    corr = q("""
-        with spx as (
-          select date_trunc('month', period_date)::date as ym, monthly_return as spx_return
-          from equities_monthly where ticker = :spx
-        ), etf as (
-          select date_trunc('month', period_date)::date as ym, monthly_return as etf_return
-          from equities_monthly where ticker = :etf
-        ), u as (
-          select date_trunc('month', period_date)::date as ym, avg(unemployment_rate) as unemployment_rate
-          from unemployment_headline
-          group by 1
-        )
-        select
-          corr(spx.spx_return, u.unemployment_rate) as corr_spx_unemp,
-          corr(etf.etf_return, u.unemployment_rate) as corr_etf_unemp
-        from spx join u using (ym)
-        join etf using (ym)
-        where ym between :start and :end
-    """, params)
+    corr = datalayer.corr_snapshot(D, SPX, sector_etf, start, end)
     st.write(corr)
 else:
     st.info("Not enough data for correlation in the selected window.")
 
-st.caption("All series aligned by month (date_trunc('month')) to avoid day mismatches. ‘Momentum’ is 1m/3m/12m total return.")
\ No newline at end of file
+# D) All ETFs × CES sectors: lead/lag correlation heatmap + rolling correlation
+st.subheader("ETF × sector correlations (monthly return vs jobs Δ% m/m)")
+MAX_LAG = 6
+
+@st.cache_data(max_entries=16)
+def corr_report(version: str, start, end, max_lag: int, pair: tuple) -> dict:
+    # Keyed on the data version, so it is recomputed only when the data or window changes
+    return analytics.correlation_report(D, start, end, max_lag, pair=pair)
+
+rep = corr_report(data_version(), start, end, MAX_LAG, (sector_etf, sector_name))
+lag = st.slider("Lag (months; positive = returns lead jobs)", -MAX_LAG, MAX_LAG, 0)
+fig3 = px.imshow(
+    rep["lead_lag"][lag + MAX_LAG], x=rep["sectors"], y=rep["tickers"],
+    zmin=-1, zmax=1, color_continuous_scale="RdBu_r", text_auto=".2f", aspect="auto",
+    labels={"x": "CES sector", "y": "Ticker", "color": "corr"},
+    title=f"corr(return_t, jobs_t{lag:+d}) · {start} → {end}",
+)
+st.plotly_chart(fig3, use_container_width=True)
+
+if rep["rolling_tickers"] and rep["rolling_sectors"]:
+    i, j = rep["tickers"].index(sector_etf), rep["sectors"].index(sector_name)
+    roll = pd.DataFrame({f"{w}m": cube[:, 0, 0] for w, cube in rep["rolling"].items()}, index=rep["months"])
+    fig4 = px.line(roll, labels={"value": "corr", "index": "Month", "variable": "Window"},
+                   title=f"Rolling correlation: {sector_etf} vs {sector_name} jobs Δ%")
+    st.plotly_chart(fig4, use_container_width=True)
+    st.caption(f"Strongest lead/lag for {sector_etf} × {sector_name}: "
+               f"{rep['best_lag'].iloc[i, j]:+.0f} months (corr {rep['best_corr'].iloc[i, j]:+.2f})")
+
+# E) State unemployment (LAUS), latest month
+st.subheader("State unemployment rate (LAUS, latest month)")
+states = D["states"]
+if not states.empty:
+    fig5 = px.choropleth(
+        states, locations="state_abbr", locationmode="USA-states", scope="usa",
+        color="unemployment_rate", color_continuous_scale="Reds", hover_name="area_text",
+        hover_data={"state_abbr": False, "rate_change_yoy": ":+.1f", "labor_force": ":,.0f"},
+        labels={"unemployment_rate": "Rate (%)", "rate_change_yoy": "YoY (pp)", "labor_force": "Labor force"},
+        title=f"Unemployment rate by state · {states['ym'].max():%b %Y}",
+    )
+    st.plotly_chart(fig5, use_container_width=True)
+else:
+    st.info("No state LAUS data yet (run etl/laus_ingest.py).")
+
+# F) Daily closes (equities_daily), downsampled so each line sends at most CHART_MAX_POINTS
+st.subheader(f"Daily closes: {SPX} vs {sector_etf}")
+
+@st.cache_data(max_entries=16)
+def daily_closes(version: str, tickers: tuple, start, end) -> pd.DataFrame:
+    try:
+        return q("""
+            select period_date, ticker, adj_close from equities_daily
+            where ticker = any(:tickers) and period_date between :lo and :hi
+            order by ticker, period_date
+        """, {"tickers": list(tickers), "lo": start, "hi": (pd.Timestamp(end) + pd.offsets.MonthEnd(0)).date()})
+    except Exception:
+        return pd.DataFrame(columns=["period_date", "ticker", "adj_close"])  # not migrated yet
+
+daily = daily_closes(data_version(), (SPX, sector_etf), start, end)
+if not daily.empty:
+    daily["period_date"] = pd.to_datetime(daily["period_date"])
+    daily["indexed"] = daily["adj_close"] / daily.groupby("ticker")["adj_close"].transform("first") * 100.0
+    shown = downsample.downsample(daily, "period_date", "indexed", by="ticker")
+    fig6 = px.line(
+        shown, x="period_date", y="indexed", color="ticker",
+        labels={"indexed": "Indexed (100 = first day)", "period_date": "Day", "ticker": "Ticker"},
+        title=f"{SPX} vs {sector_etf}, daily (indexed to 100; {start} → {end})",
+    )
+    st.plotly_chart(fig6, use_container_width=True)
+    st.caption(f"{len(shown):,} of {len(daily):,} daily points drawn "
+               f"(LTTB, at most {downsample.CHART_MAX_POINTS} per line).")
+else:
+    st.info("No daily closes yet (run etl/stocks_ingest.py --daily).")
+
+# G) Forecasts (forecasts table, written by etl/forecast.py): recent actuals, then the forecast
+# with its 80% interval
+st.subheader("Forecasts")
+FORECAST_HISTORY = 36  # months of actuals drawn before the forecast
+fc = D["forecasts"]
+if not fc.empty:
+    jobs = D["industries" if use_industry else "sectors"]
+    jobs = jobs[jobs["sector_name"] == jobs_name]
+    panels = [("unemployment_rate", "Unemployment rate (%)", D["unemployment"], "unemployment_rate")]
+    if not jobs.empty:
+        panels.append((f"ces:{jobs['sector_code'].iloc[0]}", f"{jobs_name} jobs (k)", jobs, "employment_thousands"))
+    for col, (key, label, hist, y) in zip(st.columns(2), panels):
+        f = fc[fc["series_key"] == key]
+        if f.empty:
+            col.info(f"No forecast for {label} yet.")
+            continue
+        hist = hist[["ym", y]].rename(columns={y: "actual"}).tail(FORECAST_HISTORY)
+        # The forecast line starts at the last actual month so the two lines join up
+        joined = pd.concat([hist, hist.tail(1).rename(columns={"actual": "forecast"}),
+                            f[["ym", "value", "lo80", "hi80"]].rename(columns={"value": "forecast"})],
+                           ignore_index=True)
+        fig7 = px.line(
+            joined, x="ym", y=["actual", "forecast", "lo80", "hi80"],
+            labels={"value": label, "ym": "Month", "variable": "Series"},
+            title=f"{label}: {len(f)}-month forecast",
+        )
+        fig7.update_traces(line_dash="dot", selector={"name": "lo80"})
+        fig7.update_traces(line_dash="dot", selector={"name": "hi80"})
+        col.plotly_chart(fig7, use_container_width=True)
+        col.caption(f"{f['model'].iloc[0]}, fitted through {pd.Timestamp(f['fitted_through'].iloc[0]):%b %Y}; "
+                    f"dotted lines: 80% interval.")
+else:
+    st.info("No forecasts yet (run python -m etl run --only forecast).")
+
+st.caption("All series aligned by month (stored ym month keys) to avoid day mismatches. ‘Momentum’ is 1m/3m/12m total return.")
+
+# ---------------- Debug ----------------
+if DEBUG:
+    with st.expander("Debug: query timings", expanded=True):
+        log = pd.DataFrame(list(query_log()), columns=["at", "ms", "rows", "sql"])
+        st.caption(f"Data version {data_version()} · last {len(log)} queries (of at most {QUERY_LOG_SIZE})")
+        st.write("Slowest calls")
+        st.dataframe(log.sort_values("ms", ascending=False).head(10), use_container_width=True, hide_index=True)
+        st.write("By statement")
+        by_sql = (log.groupby("sql")["ms"].agg(calls="count", total_ms="sum", mean_ms="mean", max_ms="max")
+                     .round(1).sort_values("total_ms", ascending=False).reset_index())
+        st.dataframe(by_sql, use_container_width=True, hide_index=True)
\ No newline at end of file
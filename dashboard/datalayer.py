@@ -0,0 +1,50 @@
+# dashboard/datalayer.py — load the rollups once, slice them in pandas per interaction
+import pandas as pd
+
+# One bulk read per rollup (see etl/rollups.py); everything else is in-memory slicing
+TABLES = {
+    "unemployment": "select ym, unemployment_rate from mv_unemployment order by ym",
+    "equities": "select ym, ticker, adj_close, monthly_return from mv_equities_monthly order by ticker, ym",
+    "sectors": """select ym, sector_code, sector_name, employment_thousands, emp_pct_change
+                  from mv_employment_sector order by sector_name, ym""",
+    # Detailed CES industries, same shape as "sectors" (empty until the catalog is loaded)
+    "industries": """select ym, sector_code, sector_name, employment_thousands, emp_pct_change
+                     from mv_ces_industry order by sector_name, ym""",
+    # Latest LAUS month per state (pre-aggregated; empty until etl/laus_ingest.py has run)
+    "states": """select state_abbr, area_text, ym, unemployment_rate, rate_change_yoy, labor_force
+                 from mv_laus_latest where area_type = 'A' order by state_abbr""",
+    # Written by etl/forecast.py (empty until the forecast stage has run)
+    "forecasts": """select series_key, series_name, ym, value, lo80, hi80, lo95, hi95, model, fitted_through
+                    from forecasts order by series_key, ym""",
+}
+CATEGORICAL = ["ticker", "sector_code", "sector_name", "series_key", "series_name"]
+
+def load_all(query) -> dict[str, pd.DataFrame]:
+    # query(sql) -> DataFrame; returns compact, typed, month-keyed frames
+    frames = {}
+    for name, sql in TABLES.items():
+        df = query(sql)
+        df["ym"] = pd.to_datetime(df["ym"])
+        for col in CATEGORICAL:
+            if col in df:
+                df[col] = df[col].astype("category")
+        frames[name] = df
+    return frames
+
+def window(df: pd.DataFrame, start, end) -> pd.DataFrame:
+    ym = df["ym"]
+    return df[(ym >= pd.Timestamp(start)) & (ym <= pd.Timestamp(end))]
+
+def span(df: pd.DataFrame) -> tuple:
+    return df["ym"].min().date(), df["ym"].max().date()
+
+def corr_snapshot(data: dict, spx: str, etf: str, start, end) -> pd.DataFrame:
+    # Same as the old SQL: S&P / ETF returns vs unemployment over months present in all three
+    eq = window(data["equities"], start, end)
+    s = eq.loc[eq["ticker"] == spx, ["ym", "monthly_return"]].rename(columns={"monthly_return": "spx_return"})
+    e = eq.loc[eq["ticker"] == etf, ["ym", "monthly_return"]].rename(columns={"monthly_return": "etf_return"})
+    df = s.merge(e, on="ym").merge(window(data["unemployment"], start, end), on="ym")
+    return pd.DataFrame({
+        "corr_spx_unemp": [df["spx_return"].corr(df["unemployment_rate"])],
+        "corr_etf_unemp": [df["etf_return"].corr(df["unemployment_rate"])],
+    })
@@ -0,0 +1,58 @@
+# dashboard/downsample.py — cap the points sent to Plotly for long daily series
+import os
+import numpy as np
+import pandas as pd
+
+# About the plot width in pixels at layout="wide": points beyond one per pixel only add
+# payload and render time, they are not visible
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "1200"))
+
+def _numeric(x) -> np.ndarray:
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(float)
+    return x.astype(float)
+
+def lttb(x, y, n: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: indices of n points that keep the line's visual shape.
+    # First and last points are kept; each of the n-2 buckets in between keeps the point that
+    # forms the largest triangle with the previous pick and the next bucket's mean.
+    # x sorted, y without NaNs.
+    size = len(y)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x, y = _numeric(x), np.asarray(y, dtype=float)
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+    out = np.empty(n, dtype=int)
+    out[0], out[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt = slice(hi, edges[i + 2] if i + 2 < n - 1 else size)
+        cx, cy = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+def minmax(x, y, n: int) -> np.ndarray:
+    # Min and max of each of n/2 equal-count buckets: cheaper than LTTB and keeps every spike
+    size = len(y)
+    if n >= size or n < 2:
+        return np.arange(size)
+    bucket = np.arange(size) * (n // 2) // size
+    g = pd.Series(np.asarray(y, dtype=float)).groupby(bucket)
+    return np.union1d(g.idxmin().to_numpy(), g.idxmax().to_numpy())
+
+METHODS = {"lttb": lttb, "minmax": minmax}
+
+def downsample(df: pd.DataFrame, x: str, y: str, n: int = CHART_MAX_POINTS, by: str | None = None,
+               method: str = "lttb") -> pd.DataFrame:
+    # At most n rows per line (one line per value of `by`), sorted by x
+    pick = METHODS[method]
+    groups = df.groupby(by, observed=True, sort=False) if by else [(None, df)]
+    parts = []
+    for _, g in groups:
+        g = g.sort_values(x)
+        parts.append(g.iloc[pick(g[x].to_numpy(), g[y].to_numpy(), n)])
+    return pd.concat(parts, ignore_index=True) if parts else df
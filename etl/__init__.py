@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# The ETL modules import each other flat (they also run as scripts from etl/),
+# so expose this directory when the package is imported as `etl`.
+_ETL_DIR = str(Path(__file__).resolve().parent)
+if _ETL_DIR not in sys.path:
+    sys.path.insert(0, _ETL_DIR)
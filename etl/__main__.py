@@ -0,0 +1,4 @@
+from pipeline import main  # etl/__init__ puts etl/ on sys.path
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# etl/arima.py — ARIMA(p,1,0) with drift in plain numpy, for etl/forecast.py.
+# Kept free of pandas/DB imports: it is the only module the forecast worker processes import.
+import numpy as np
+
+MAX_LAG = 6
+QUANTILES = {"lo95": 2.5, "lo80": 10.0, "hi80": 90.0, "hi95": 97.5}
+
+def _design(d: np.ndarray, p: int, start: int) -> tuple[np.ndarray, np.ndarray]:
+    # Rows t = start..n-1 of d_t = c + phi_1 d_{t-1} + ... + phi_p d_{t-p}
+    n = len(d)
+    X = np.column_stack([np.ones(n - start)] + [d[start - i:n - i] for i in range(1, p + 1)])
+    return X, d[start:]
+
+def fit(d: np.ndarray, max_lag: int = MAX_LAG) -> dict:
+    # Least squares AR(p) on the differences; p by AIC on a common sample (the first max_lag
+    # rows dropped for every p), then refit on every row the chosen p allows
+    best = None
+    for p in range(1, max_lag + 1):
+        X, t = _design(d, p, max_lag)
+        r = t - X @ np.linalg.lstsq(X, t, rcond=None)[0]
+        aic = len(t) * np.log(max(r @ r / len(t), 1e-300)) + 2 * (p + 1)
+        if best is None or aic < best[0]:
+            best = (aic, p)
+    p = best[1]
+    X, t = _design(d, p, p)
+    coef = np.linalg.lstsq(X, t, rcond=None)[0]
+    return {"p": p, "coef": coef.tolist(), "resid": (t - X @ coef).tolist()}
+
+def simulate(d: np.ndarray, last: float, model: dict, horizon: int, paths: int, seed: int) -> dict:
+    # Point path (no shocks) plus `paths` paths driven by resampled residuals, all stepped
+    # together; levels are last + cumulative differences. Returns arrays of length horizon.
+    coef = np.asarray(model["coef"])
+    c, phi = coef[0], coef[1:]
+    resid = np.asarray(model["resid"])
+    rng = np.random.default_rng(seed)
+    shocks = np.vstack([np.zeros(horizon), rng.choice(resid - resid.mean(), size=(paths, horizon))])
+    lags = np.tile(d[::-1][:len(phi)], (paths + 1, 1))  # most recent difference first
+    steps = np.empty((paths + 1, horizon))
+    for h in range(horizon):
+        steps[:, h] = c + lags @ phi + shocks[:, h]
+        lags = np.column_stack([steps[:, h], lags[:, :-1]])
+    levels = last + np.cumsum(steps, axis=1)
+    out = {"value": levels[0]}
+    bands = np.percentile(levels[1:], list(QUANTILES.values()), axis=0)
+    out.update(zip(QUANTILES, bands))
+    return out
+
+def forecast(task: dict) -> dict:
+    # task: key, y (monthly levels, oldest first), log, model (None = fit), horizon, paths,
+    # fit_months, max_lag, seed. Log series are modelled in log differences.
+    y = np.asarray(task["y"], dtype=float)[-task["fit_months"] - 1:]
+    z = np.log(y) if task["log"] else y
+    d = np.diff(z)
+    model = task["model"] or fit(d, task["max_lag"])
+    out = simulate(d, z[-1], model, task["horizon"], task["paths"], task["seed"])
+    if task["log"]:
+        out = {k: np.exp(v) for k, v in out.items()}
+    return {"key": task["key"], "model": model, "bands": {k: v.tolist() for k, v in out.items()}}
+
+def forecast_chunk(tasks: list[dict]) -> list[dict]:
+    # One pool task per chunk, so per-task pickling and scheduling stay small next to the fits
+    return [forecast(t) for t in tasks]
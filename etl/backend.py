@@ -0,0 +1,169 @@
+import os
+import re
+import threading
+import datetime as dt
+from pathlib import Path
+import duckdb
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import text
+from common import get_engine, db_configured
+from store import DATA_DIR, DATASETS, HASH_FILE
+from rollups import ROLLUPS
+from ces_catalog import read_catalog, CATALOG_DIR
+import metrics
+
+# Storage backend shared by the loader and the dashboard, chosen with ETL_BACKEND:
+#   postgres  (default) the database from DATABASE_URL / PG* vars, loaded by load_to_db.py
+#   duckdb    an embedded DuckDB file (DUCKDB_PATH) for single-node setups, CI and benchmarks.
+#             Its base tables are views over the Parquet datasets in the store (nothing is
+#             copied) and the rollups are plain tables, rebuilt by every load.
+# Queries use :name parameters and SQL both engines accept; anything else goes per backend.
+BACKEND = os.getenv("ETL_BACKEND", "postgres").strip().lower()
+DUCKDB_PATH = Path(os.getenv("DUCKDB_PATH", DATA_DIR / "warehouse.duckdb"))
+
+def configured() -> bool:
+    return BACKEND == "duckdb" or db_configured()
+
+# ---------------- Queries ----------------
+
+_engine = None
+_readers = {}  # warehouse path -> ((inode, mtime), connection)
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+
+def query(sql: str, params: dict | None = None) -> pd.DataFrame:
+    # Read-only query on the configured backend
+    if BACKEND == "duckdb":
+        return duck_query(sql, params)
+    global _engine
+    with _lock:
+        if _engine is None:
+            _engine = get_engine()
+    with _engine.connect() as c:
+        return pd.read_sql(text(sql), c, params=params or {})
+
+_PARAM = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")  # :name, not ::type casts
+
+def _duck_reader(path: Path):
+    # One read-only connection per warehouse file. Loads swap in a new file instead of writing
+    # in place, so a new inode/mtime means a new file to attach; queries already running on the
+    # old connection finish on the old file. Attaching into a private in-memory instance
+    # sidesteps duckdb's per-path instance cache, which would keep serving the old file.
+    st = path.stat()  # FileNotFoundError until the first load
+    ident = (st.st_ino, st.st_mtime_ns)
+    with _lock:
+        cached = _readers.get(path)
+        if cached is None or cached[0] != ident:
+            con = duckdb.connect()
+            con.execute(f"attach '{path}' as warehouse (read_only)")
+            cached = _readers[path] = (ident, con)
+        return cached[1]
+
+def duck_query(sql: str, params: dict | None = None, path: Path = DUCKDB_PATH) -> pd.DataFrame:
+    cur = _duck_reader(path).cursor()  # cursors are per thread; cheap, unlike a new connection
+    cur.execute("use warehouse")
+    if params:
+        return cur.execute(_PARAM.sub(r"$\1", sql), params).df()
+    return cur.execute(sql).df()
+
+# ---------------- DuckDB load ----------------
+
+# Base tables named like the Postgres ones, so the rollup SQL runs unchanged
+DUCK_VIEWS = {
+    "unemployment_headline": "unemployment",
+    "employment_sector": "ces",
+    "equities_monthly": "equities",
+    "equities_daily": "equities_daily",
+    "ces_observations": "ces_catalog",
+    "forecasts": "forecasts",
+}
+
+# Postgres-only inputs (LAUS streams straight into Postgres; the CES series table is read from
+# the catalog files below): empty here, so every rollup exists on both backends
+DUCK_TABLES = [
+    """create table ces_series (
+           series_id varchar, supersector_code varchar, supersector_name varchar, industry_code varchar,
+           naics_code varchar, industry_name varchar, display_level integer, parent_code varchar,
+           path varchar, data_type_code varchar, data_type_text varchar, seasonal varchar,
+           series_title varchar, begin_year integer, end_year integer
+       )""",
+    """create table laus_areas (
+           area_code varchar, area_type varchar, area_text varchar, state_fips varchar, state_abbr varchar
+       )""",
+    """create table laus_observations (
+           series_id varchar, area_code varchar, measure_code varchar, seasonal varchar,
+           period_date date, value double, preliminary boolean, ym date
+       )""",
+]
+
+def _fingerprint(path: Path) -> str:
+    # Datasets: the content hash write_dataset keeps with them (it changes only with the rows);
+    # other files (and datasets written before it existed): inode/mtime
+    if not path.exists():
+        return "missing"
+    if (path / HASH_FILE).exists():
+        return (path / HASH_FILE).read_text()
+    st = path.stat()
+    return f"{st.st_ino}:{st.st_mtime_ns}"
+
+def _duck_view(con, table: str, dataset: str, data_dir: Path) -> None:
+    path = data_dir / dataset
+    if any(path.glob("year=*/*.parquet")):
+        con.execute(f"""
+            create view {table} as
+            select * exclude (year), date_trunc('month', period_date)::date as ym
+            from read_parquet('{path}/year=*/*.parquet', hive_partitioning = true)
+        """)
+        return
+    # Not produced yet: an empty table of the same shape
+    schema = DATASETS[dataset]["schema"]
+    empty = pa.schema([(f.name, pa.string() if pa.types.is_dictionary(f.type) else f.type) for f in schema]).empty_table()
+    con.register("_empty", empty)
+    con.execute(f"create table {table} as select *, date_trunc('month', period_date)::date as ym from _empty")
+    con.unregister("_empty")
+
+def _duck_versions(path: Path) -> dict:
+    try:
+        v = duck_query("select table_name, version, fingerprint from etl_data_version", path=path)
+    except Exception:
+        return {}
+    return {r.table_name: (int(r.version), r.fingerprint) for r in v.itertuples()}
+
+def load_duckdb(path: Path = DUCKDB_PATH, data_dir: Path = DATA_DIR) -> list[str]:
+    # Build the whole warehouse beside the live file, then swap it in. Returns the base tables
+    # whose data changed since the previous load; their etl_data_version rows are bumped.
+    # Loads run one at a time (the pipeline's load and load_catalog stages may overlap)
+    with _load_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.unlink(missing_ok=True)
+        old = _duck_versions(path) if path.exists() else {}
+        fingerprints = {t: _fingerprint(data_dir / d) for t, d in DUCK_VIEWS.items()}
+        fingerprints["ces_series"] = _fingerprint(CATALOG_DIR / "ce.series")
+        con = duckdb.connect(str(tmp))
+        try:
+            for ddl in DUCK_TABLES:
+                con.execute(ddl)
+            for table, dataset in DUCK_VIEWS.items():
+                _duck_view(con, table, dataset, data_dir)
+            cat = read_catalog()
+            if cat is not None:
+                con.register("_catalog", cat)
+                con.execute("insert into ces_series by name select * from _catalog")
+                con.unregister("_catalog")
+            with metrics.timed("rollups_s"):
+                for name, spec in ROLLUPS.items():
+                    con.execute(f"create table {name} as {spec['sql']}")
+            changed = [t for t, fp in fingerprints.items() if old.get(t, (0, None))[1] != fp]
+            con.execute("""create table etl_data_version (
+                               table_name varchar primary key, version integer, fingerprint varchar, loaded_at timestamp
+                           )""")
+            now = dt.datetime.now()
+            con.executemany("insert into etl_data_version values (?, ?, ?, ?)",
+                            [(t, old.get(t, (0, None))[0] + (t in changed), fp, now) for t, fp in fingerprints.items()])
+        finally:
+            con.close()
+        os.replace(tmp, path)
+        print(f"DuckDB warehouse {path}: {len(ROLLUPS)} rollups rebuilt; changed: {', '.join(changed) or 'none'}")
+        return changed
@@ -1,10 +1,12 @@
 import os
-import sys
+import argparse
 import datetime as dt
 import pandas as pd
-from common import bls_fetch
+from common import bls_fetch, bls_frame, latest_period, read_existing, revision_start_year, merge_incremental
+from store import write_dataset
 
 DEFAULT_START = int(os.getenv("BLS_START_YEAR", "2000"))
+DATASET = "ces"
 
 CES_SUPERSECTORS = {
     "CES0500000001": "Total Private",
@@ -24,31 +26,49 @@ CES_SUPERSECTORS = {
     "CES5000000001": "Information",
 }
 
-def main():
-    # Allow CLI override: python etl/bls_ces_ingest.py 2000 2025
-    start_year = int(sys.argv[1]) if len(sys.argv) >= 2 else DEFAULT_START
-    end_year = int(sys.argv[2]) if len(sys.argv) >= 3 else dt.date.today().year
+def parse_args(argv=None):
+    # Allow CLI override: python etl/bls_ces_ingest.py 2000 2025 [--full]
+    ap = argparse.ArgumentParser(description="Fetch BLS CES supersector employment")
+    ap.add_argument("start_year", nargs="?", type=int, default=DEFAULT_START)
+    ap.add_argument("end_year", nargs="?", type=int, default=dt.date.today().year)
+    ap.add_argument("--full", action="store_true", help="ignore the watermark and rebuild from start_year")
+    ap.add_argument("--csv", action="store_true", default=None, help="also export the legacy CSV")
+    ap.add_argument("--offline", action="store_true", help="replay BLS responses from the disk cache only")
+    return ap.parse_args(argv)
+
+def to_frame(series) -> pd.DataFrame:
+    obs = bls_frame(series)
+    return pd.DataFrame({
+        "period_date": obs["period_date"],
+        "sector_code": obs["series_id"],
+        "sector_name": obs["series_id"].map(CES_SUPERSECTORS).fillna(obs["series_id"]),
+        "employment_thousands": obs["value"],
+    }).dropna()
+
+def build(start_year=DEFAULT_START, end_year=None, full=False, offline=None) -> pd.DataFrame:
+    end_year = end_year or dt.date.today().year
+    watermark = None if full else latest_period(DATASET, "employment_sector")
+    if watermark is not None:
+        start_year = max(start_year, revision_start_year(watermark))
+        print(f"Incremental: latest stored month {watermark}, refetching from {start_year}")
 
     print(f"Fetching BLS CES supersectors {start_year} → {end_year} ...")
-    series = bls_fetch(list(CES_SUPERSECTORS.keys()), start_year=start_year, end_year=end_year)
-    recs = []
-    for s in series:
-        code = s["seriesID"]; name = CES_SUPERSECTORS.get(code, code)
-        for item in s["data"]:
-            y = int(item["year"]); m = int(item["period"][1:])
-            recs.append({
-                "period_date": dt.date(y, m, 1),
-                "sector_code": code,
-                "sector_name": name,
-                "employment_thousands": pd.to_numeric(item["value"], errors="coerce"),
-            })
-    df = (pd.DataFrame(recs)
-          .dropna()
-          .drop_duplicates()
+    series = bls_fetch(list(CES_SUPERSECTORS.keys()), start_year=start_year, end_year=end_year,
+                        offline=offline)
+    df = to_frame(series)
+    existing = read_existing(DATASET, "employment_sector") if watermark is not None else None
+    if existing is not None:
+        df = merge_incremental(existing, df, ["period_date", "sector_code"])
+    df = (df.drop_duplicates()
           .sort_values(["sector_name", "period_date"])
           .reset_index(drop=True))
-    df.to_csv("bls_ces_supersectors.csv", index=False)
-    print(f"Saved bls_ces_supersectors.csv ({df['period_date'].min()} → {df['period_date'].max()})")
+    return df
+
+def main(argv=None):
+    args = parse_args(argv)
+    df = build(args.start_year, args.end_year, full=args.full, offline=args.offline or None)
+    path = write_dataset(DATASET, df, csv=args.csv)
+    print(f"Saved {path} ({df['period_date'].min().date()} → {df['period_date'].max().date()})")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,35 +1,52 @@
 import os
-import sys
+import argparse
 import datetime as dt
 import pandas as pd
-from common import bls_fetch
+from common import bls_fetch, bls_frame, latest_period, read_existing, revision_start_year, merge_incremental
+from store import write_dataset
 
 DEFAULT_START = int(os.getenv("BLS_START_YEAR", "2000"))
+DATASET = "unemployment"
 
 HEADLINE_SERIES = ["LNS14000000"]  # U-3 unemployment rate, SA, monthly
 
-def main():
-    # Allow CLI override: python etl/bls_ingest.py 2000 2025
-    start_year = int(sys.argv[1]) if len(sys.argv) >= 2 else DEFAULT_START
-    end_year = int(sys.argv[2]) if len(sys.argv) >= 3 else dt.date.today().year
+def parse_args(argv=None):
+    # Allow CLI override: python etl/bls_ingest.py 2000 2025 [--full]
+    ap = argparse.ArgumentParser(description="Fetch BLS headline unemployment")
+    ap.add_argument("start_year", nargs="?", type=int, default=DEFAULT_START)
+    ap.add_argument("end_year", nargs="?", type=int, default=dt.date.today().year)
+    ap.add_argument("--full", action="store_true", help="ignore the watermark and rebuild from start_year")
+    ap.add_argument("--csv", action="store_true", default=None, help="also export the legacy CSV")
+    ap.add_argument("--offline", action="store_true", help="replay BLS responses from the disk cache only")
+    return ap.parse_args(argv)
+
+def build(start_year=DEFAULT_START, end_year=None, full=False, offline=None) -> pd.DataFrame:
+    end_year = end_year or dt.date.today().year
+    watermark = None if full else latest_period(DATASET, "unemployment_headline")
+    if watermark is not None:
+        start_year = max(start_year, revision_start_year(watermark))
+        print(f"Incremental: latest stored month {watermark}, refetching from {start_year}")
 
     print(f"Fetching BLS headline unemployment {start_year} → {end_year} ...")
-    series = bls_fetch(HEADLINE_SERIES, start_year=start_year, end_year=end_year)
-    rows = []
-    for s in series:
-        for item in s["data"]:
-            y = int(item["year"]); m = int(item["period"][1:])
-            rows.append({
-                "period_date": dt.date(y, m, 1),
-                "unemployment_rate": pd.to_numeric(item["value"], errors="coerce"),
-            })
-    df = (pd.DataFrame(rows)
-          .dropna()
-          .drop_duplicates()
+    series = bls_fetch(HEADLINE_SERIES, start_year=start_year, end_year=end_year,
+                        offline=offline)
+    obs = bls_frame(series)
+    df = (obs[["period_date", "value"]]
+          .rename(columns={"value": "unemployment_rate"})
+          .dropna())
+    existing = read_existing(DATASET, "unemployment_headline") if watermark is not None else None
+    if existing is not None:
+        df = merge_incremental(existing, df, ["period_date"])
+    df = (df.drop_duplicates()
           .sort_values("period_date")
           .reset_index(drop=True))
-    df.to_csv("bls_unemployment.csv", index=False)
-    print(f"Saved bls_unemployment.csv ({df['period_date'].min()} → {df['period_date'].max()})")
+    return df
+
+def main(argv=None):
+    args = parse_args(argv)
+    df = build(args.start_year, args.end_year, full=args.full, offline=args.offline or None)
+    path = write_dataset(DATASET, df, csv=args.csv)
+    print(f"Saved {path} ({df['period_date'].min().date()} → {df['period_date'].max().date()})")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
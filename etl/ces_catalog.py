@@ -0,0 +1,261 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import datetime as dt
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from sqlalchemy import text
+from common import (bls_request, bls_frame, bls_limits, bls_quota_left, merge_incremental,
+                    revision_start_year, get_engine, db_configured, read_existing, BLS_WORKERS)
+from store import DATA_DIR, read_dataset, write_dataset
+import metrics
+
+# Detailed CES industry catalog (employment, hours, earnings) driven by the BLS series
+# definition files. Download ce.series (required) plus ce.industry, ce.supersector and
+# ce.datatype from https://download.bls.gov/pub/time.series/ce/ into CES_CATALOG_DIR.
+DEFAULT_START = int(os.getenv("BLS_START_YEAR", "2000"))
+DATASET = "ces_catalog"
+TABLE = "ces_observations"
+CATALOG_DIR = Path(os.getenv("CES_CATALOG_DIR", DATA_DIR / "catalog"))
+DATA_TYPES = os.getenv("CES_DATA_TYPES", "01,02,03")  # all employees, avg weekly hours, avg hourly earnings
+QUOTA_RESERVE = int(os.getenv("CES_QUOTA_RESERVE", "10"))  # left for the headline/supersector ingests
+STATE_PATH = DATA_DIR / ".ces_catalog_state.json"
+PARTS_DIR = DATA_DIR / ".ces_catalog"
+
+# ---------------- Catalog ----------------
+
+def read_flat(path: Path) -> pd.DataFrame | None:
+    # BLS flat files: tab-separated, padded headers and values
+    if not path.exists():
+        return None
+    df = pd.read_csv(path, sep="\t", dtype=str, keep_default_na=False)
+    df.columns = df.columns.str.strip()
+    return df.apply(lambda col: col.str.strip())
+
+def _hierarchy(industry: pd.DataFrame) -> pd.DataFrame:
+    # ce.industry is a pre-order listing: each row's parent is the nearest earlier row
+    # with a smaller display_level
+    industry = industry.assign(display_level=industry["display_level"].astype(int),
+                               sort_sequence=industry["sort_sequence"].astype(int))
+    industry = industry.sort_values("sort_sequence")
+    stack, parents, paths = [], [], []
+    for code, name, level in industry[["industry_code", "industry_name", "display_level"]].itertuples(index=False):
+        while stack and stack[-1][2] >= level:
+            stack.pop()
+        parents.append(stack[-1][0] if stack else None)
+        paths.append(" > ".join([s[1] for s in stack] + [name]))
+        stack.append((code, name, level))
+    return industry.assign(parent_code=parents, path=paths)
+
+def read_catalog(data_types=DATA_TYPES, seasonal: str | None = "S", max_level: int | None = None) -> pd.DataFrame | None:
+    # One row per series: codes, titles, years available and its place in the industry tree
+    series = read_flat(CATALOG_DIR / "ce.series")
+    if series is None:
+        print(f"CES catalog: {CATALOG_DIR / 'ce.series'} not found; skipping")
+        return None
+    types = [t.strip() for t in data_types.split(",")] if isinstance(data_types, str) else list(data_types)
+    keep = series["data_type_code"].isin(types)
+    if seasonal:
+        keep &= series["seasonal"] == seasonal
+    series = series[keep]
+    cat = pd.DataFrame({
+        "series_id": series["series_id"],
+        "supersector_code": series["supersector_code"],
+        "industry_code": series["industry_code"],
+        "data_type_code": series["data_type_code"],
+        "seasonal": series["seasonal"],
+        "series_title": series["series_title"],
+        "begin_year": series["begin_year"].astype(int),
+        "end_year": series["end_year"].astype(int),
+    })
+    for name, key, cols in (("ce.supersector", "supersector_code", ["supersector_name"]),
+                            ("ce.datatype", "data_type_code", ["data_type_text"])):
+        extra = read_flat(CATALOG_DIR / name)
+        cat = cat.merge(extra[[key] + cols], on=key, how="left") if extra is not None else cat.assign(**{c: None for c in cols})
+    industry = read_flat(CATALOG_DIR / "ce.industry")
+    tree_cols = ["industry_code", "naics_code", "industry_name", "display_level", "parent_code", "path"]
+    if industry is not None:
+        cat = cat.merge(_hierarchy(industry)[tree_cols], on="industry_code", how="left")
+    else:
+        cat = cat.assign(**{c: None for c in tree_cols[1:]})
+    if max_level is not None and industry is not None:
+        cat = cat[cat["display_level"] <= max_level]
+    return cat.sort_values("series_id").reset_index(drop=True)
+
+# ---------------- Planning ----------------
+
+def plan_requests(need: pd.DataFrame, max_series: int, max_years: int, anchor: int) -> list[list]:
+    # need: series_id, start, end. Years are cut into fixed max_years blocks from anchor; per
+    # block, series needing it are packed max_series at a time (sorted by start, so each request
+    # asks only for the years its members need). That is ceil(n_block / max_series) per block.
+    reqs = []
+    for lo in range(anchor, int(need["end"].max()) + 1, max_years):
+        hi = lo + max_years - 1
+        blk = need[(need["start"] <= hi) & (need["end"] >= lo)].sort_values(["start", "series_id"])
+        for i in range(0, len(blk), max_series):
+            part = blk.iloc[i:i + max_series]
+            reqs.append([part["series_id"].tolist(), max(lo, int(part["start"].min())), min(hi, int(part["end"].max()))])
+    return reqs
+
+def _db_watermarks() -> pd.Series | None:
+    if not db_configured():
+        return None
+    try:
+        with get_engine().connect() as c:
+            df = pd.read_sql(text(f"select series_id, max(period_date) as last from {TABLE} group by 1"), c)
+    except Exception as e:
+        print(f"{TABLE}: could not read watermarks ({e})")
+        return None
+    return pd.to_datetime(df.set_index("series_id")["last"])
+
+def _watermarks() -> pd.Series | None:
+    # Per-series last stored month, the newer of the store's and the database's (a fresh runner
+    # has an empty store but a loaded ces_observations)
+    stored = read_dataset(DATASET, columns=["series_id", "period_date"])
+    marks = [m for m in (
+        stored.groupby("series_id", observed=True)["period_date"].max() if stored is not None else None,
+        _db_watermarks(),
+    ) if m is not None and not m.empty]
+    if not marks:
+        return None
+    last = pd.concat(marks)
+    last.index = last.index.astype(str)
+    return last.groupby(level=0).max()
+
+def _needs(cat: pd.DataFrame, start_year: int, end_year: int, full: bool) -> pd.DataFrame:
+    # Stored series refetch the BLS revision window; new ones their whole available history.
+    # Series that ended before the catalog's latest year are discontinued: fetch up to their end.
+    start = cat["begin_year"].clip(lower=start_year)
+    last = None if full else _watermarks()
+    if last is not None and not last.empty:
+        since = cat["series_id"].map(last.map(revision_start_year))
+        start = since.fillna(start).clip(lower=start).astype(int)
+        done = cat["series_id"].isin(last.index) & (cat["end_year"] < cat["end_year"].max())
+        cat, start = cat[~done], start[~done]
+    end = cat["end_year"].where(cat["end_year"] < cat["end_year"].max(), end_year).clip(upper=end_year)
+    need = pd.DataFrame({"series_id": cat["series_id"], "start": start, "end": end})
+    return need[need["start"] <= need["end"]]
+
+def _plan_id(reqs: list) -> str:
+    return hashlib.sha256(json.dumps(reqs).encode()).hexdigest()[:16]
+
+# ---------------- Progress ----------------
+
+def _read_state() -> dict | None:
+    try:
+        return json.loads(STATE_PATH.read_text())
+    except (OSError, ValueError):
+        return None
+
+def _write_state(state: dict) -> None:
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, STATE_PATH)
+
+def _new_plan(cat, start_year, end_year, full) -> dict:
+    max_series, max_years = bls_limits()
+    need = _needs(cat, start_year, end_year, full)
+    reqs = plan_requests(need, max_series, max_years, start_year) if not need.empty else []
+    shutil.rmtree(PARTS_DIR, ignore_errors=True)
+    state = {"plan": _plan_id(reqs), "created": dt.datetime.now().isoformat(timespec="seconds"),
+             "requests": reqs, "done": []}
+    _write_state(state)
+    print(f"CES catalog: planned {len(reqs)} requests for {len(need)} series "
+          f"({max_series} series x {max_years} years per request)")
+    return state
+
+def _fetch(i, ids, sy, ey, offline) -> pd.DataFrame:
+    obs = bls_frame(bls_request(ids, sy, ey, offline=offline))
+    df = obs[["period_date", "series_id", "value", "preliminary"]].dropna(subset=["value"])
+    PARTS_DIR.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(PARTS_DIR / f"part-{i:05d}.parquet", index=False)
+    return df
+
+def run_plan(state: dict, offline=None, max_requests: int | None = None) -> dict:
+    # Spend at most today's remaining quota (minus a reserve) on pending requests. Progress is
+    # saved after every request, so an interrupted or quota-limited run resumes where it stopped.
+    pending = [i for i in range(len(state["requests"])) if i not in set(state["done"])]
+    budget = len(pending) if offline else max(bls_quota_left() - QUOTA_RESERVE, 0)
+    if max_requests is not None:
+        budget = min(budget, max_requests)
+    batch = pending[:budget]
+    print(f"CES catalog: {len(state['done'])}/{len(state['requests'])} requests done, "
+          f"running {len(batch)} now ({len(pending) - len(batch)} left for later runs)")
+    lock = threading.Lock()
+    fetch = metrics.bind(_fetch)
+    with ThreadPoolExecutor(max_workers=max(1, min(BLS_WORKERS, len(batch) or 1))) as pool:
+        futures = {pool.submit(fetch, i, *state["requests"][i], offline): i for i in batch}
+        for fut in as_completed(futures):
+            if fut.cancelled():
+                continue
+            try:
+                fut.result()
+            except Exception as e:
+                # Typically the daily quota ("REQUEST_NOT_PROCESSED"): stop and resume tomorrow
+                print(f"CES catalog: request {futures[fut]} failed ({e}); stopping")
+                for f in futures:
+                    f.cancel()
+                continue
+            with lock:
+                state["done"].append(futures[fut])
+                _write_state(state)
+    metrics.count("catalog_requests_pending", len(state["requests"]) - len(state["done"]))
+    return state
+
+def _collect() -> pd.DataFrame | None:
+    parts = sorted(PARTS_DIR.glob("part-*.parquet"))
+    return pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True) if parts else None
+
+# ---------------- Build ----------------
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Fetch the detailed BLS CES catalog within the daily quota")
+    ap.add_argument("start_year", nargs="?", type=int, default=DEFAULT_START)
+    ap.add_argument("end_year", nargs="?", type=int, default=dt.date.today().year)
+    ap.add_argument("--full", action="store_true", help="ignore stored series and plan their whole history")
+    ap.add_argument("--replan", action="store_true", help="discard the saved plan and progress")
+    ap.add_argument("--max-requests", type=int, default=None, help="cap on requests this run")
+    ap.add_argument("--data-types", default=DATA_TYPES, help="comma-separated CES data type codes")
+    ap.add_argument("--max-level", type=int, default=None, help="deepest industry display level")
+    ap.add_argument("--csv", action="store_true", default=None, help="also export a CSV")
+    ap.add_argument("--offline", action="store_true", help="replay BLS responses from the disk cache only")
+    return ap.parse_args(argv)
+
+def build(start_year=DEFAULT_START, end_year=None, full=False, offline=None, replan=False,
+          max_requests=None, data_types=DATA_TYPES, max_level=None) -> pd.DataFrame | None:
+    end_year = end_year or dt.date.today().year
+    cat = read_catalog(data_types, max_level=max_level)
+    if cat is None:
+        return None
+    state = None if replan else _read_state()
+    if state is None or len(state["done"]) == len(state["requests"]):
+        state = _new_plan(cat, start_year, end_year, full)
+    state = run_plan(state, offline=offline, max_requests=max_requests)
+
+    # Parts of the current plan win over stored rows (revisions), whatever --full planned.
+    # They hold only this plan's series and years: if the stored rows cannot be read,
+    # read_existing raises and nothing is written over them.
+    fresh = _collect()
+    existing = read_existing(DATASET, TABLE)
+    if fresh is None:
+        return existing
+    df = merge_incremental(existing, fresh, ["series_id", "period_date"]) if existing is not None else fresh
+    return df.sort_values(["series_id", "period_date"]).reset_index(drop=True)
+
+def main(argv=None):
+    args = parse_args(argv)
+    df = build(args.start_year, args.end_year, full=args.full, offline=args.offline or None,
+               replan=args.replan, max_requests=args.max_requests, data_types=args.data_types,
+               max_level=args.max_level)
+    if df is None:
+        return
+    path = write_dataset(DATASET, df, csv=args.csv)
+    print(f"Saved {path} ({df['series_id'].nunique()} series, {len(df)} rows)")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,21 @@
 import os
 from pathlib import Path
+import io
+import json
+import time
+import hashlib
+import threading
 import datetime as dt
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
+from store import read_dataset
+import metrics
 
 # --- Load .env from repo root (.. relative to this file) ---
 REPO_ROOT = Path(__file__).resolve().parents[1]
@@ -13,20 +24,238 @@ load_dotenv(dotenv_path=ENV_PATH)
 
 # ---------------- BLS ----------------
 BLS_API_KEY = os.getenv("BLS_API_KEY")  # optional
+BLS_URL = "https://api.bls.gov/publicAPI/v2/timeseries/data/"
+BLS_WORKERS = int(os.getenv("BLS_WORKERS", "4"))
+BLS_RETRIES = int(os.getenv("BLS_RETRIES", "4"))
+BLS_BACKOFF = float(os.getenv("BLS_BACKOFF", "1.0"))  # seconds, doubled per retry
+RETRY_STATUS = {429, 500, 502, 503, 504}
 
-def bls_fetch(series_ids, start_year=2000, end_year=None, timeout=60):
-    if end_year is None:
-        end_year = dt.date.today().year
-    payload = {"seriesid": list(series_ids), "startyear": str(start_year), "endyear": str(end_year)}
+# BLS v2 per-request limits: registered keys get 50 series x 20 years, anonymous 25 x 10
+def bls_limits() -> tuple[int, int]:
+    return (50, 20) if BLS_API_KEY else (25, 10)
+
+# ---------------- BLS daily quota ----------------
+# Registered keys get 500 queries a day, anonymous use 25. Every HTTP attempt (retries too)
+# is counted in a small ledger so long jobs can budget what is left of the day.
+BLS_DAILY_QUOTA = int(os.getenv("BLS_DAILY_QUOTA", "500" if BLS_API_KEY else "25"))
+BLS_QUOTA_PATH = REPO_ROOT / ".cache" / "bls_quota.json"
+_quota_lock = threading.Lock()
+
+def _quota_day() -> str:
+    # The quota resets at midnight US Eastern
+    return dt.datetime.now(ZoneInfo("America/New_York")).date().isoformat()
+
+def bls_quota_used() -> int:
+    try:
+        ledger = json.loads(BLS_QUOTA_PATH.read_text())
+    except (OSError, ValueError):
+        return 0
+    return ledger["used"] if ledger.get("day") == _quota_day() else 0
+
+def bls_quota_left() -> int:
+    return max(BLS_DAILY_QUOTA - bls_quota_used(), 0)
+
+def _quota_spend(n: int = 1) -> None:
+    with _quota_lock:
+        used = bls_quota_used() + n
+        BLS_QUOTA_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp = BLS_QUOTA_PATH.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"day": _quota_day(), "used": used}))
+        os.replace(tmp, BLS_QUOTA_PATH)
+
+# ---------------- BLS parsing ----------------
+# BLS period codes: M01-M12 monthly, M13 annual average, Q01-Q05 quarterly, S01-S03 semiannual, A01 annual
+BLS_COLUMNS = ["series_id", "period_date", "year", "period", "freq", "value", "footnotes", "preliminary"]
+
+def _footnote_codes(fns) -> str:
+    return ",".join(f["code"] for f in fns if f and f.get("code"))
+
+def bls_frame(series, freq: str | None = "M") -> pd.DataFrame:
+    with metrics.timed("bls_parse_s"):
+        return _bls_frame(series, freq)
+
+def _bls_frame(series, freq):
+    # Flatten series[].data[] into column arrays in one pass, then convert vectorized.
+    # freq="M" keeps true months only (M13 is routed to "A"); freq=None keeps every period.
+    sid, year, period, value, notes = [], [], [], [], []
+    for s in series:
+        data = s.get("data", [])
+        sid += [s["seriesID"]] * len(data)
+        year += [d["year"] for d in data]
+        period += [d["period"] for d in data]
+        value += [d["value"] for d in data]
+        # Nearly every observation carries a single (often empty) footnote
+        fns = [d.get("footnotes") or [{}] for d in data]
+        notes += [fn[0].get("code", "") if len(fn) == 1 else _footnote_codes(fn) for fn in fns]
+    if not sid:
+        return pd.DataFrame(columns=BLS_COLUMNS)
+    metrics.count("bls_observations", len(sid))
+
+    # Period codes are fixed-width "X99": read the letter and digits straight from the code points
+    chars = np.array(period, dtype="U3").view(np.uint32).reshape(-1, 3)
+    kind = chars[:, 0].view("U1")
+    num = (chars[:, 1].astype(np.int32) - 48) * 10 + (chars[:, 2].astype(np.int32) - 48)
+    freq_col = np.where((kind == "M") & (num == 13), "A", kind)
+    years = np.array(year, dtype="U4").astype(np.int32)
+    months = np.where(freq_col == "M", num, 1)
+    notes = np.array(notes, dtype=object)
+
+    df = pd.DataFrame({
+        "series_id": np.array(sid, dtype=object),
+        "period_date": ((years - 1970) * 12 + months - 1).astype("datetime64[M]").astype("datetime64[ns]"),
+        "year": years,
+        "period": np.array(period, dtype=object),
+        "freq": freq_col.astype(object),
+        "value": pd.to_numeric(np.array(value, dtype=object), errors="coerce"),
+        "footnotes": notes,
+        "preliminary": np.char.find(notes.astype(str), "P") >= 0,
+    })
+    if freq is not None:
+        keep = (freq_col == freq)
+        if not keep.all():
+            skipped = df.loc[~keep, "period"].value_counts().to_dict()
+            print(f"BLS parse: skipped {int((~keep).sum())} non-{freq} observations {skipped}")
+        df = df[keep].reset_index(drop=True)
+    return df
+
+# ---------------- BLS response cache ----------------
+# Content-addressed by the normalized request (series, years; never the API key)
+BLS_CACHE = os.getenv("BLS_CACHE", "1") != "0"
+BLS_CACHE_DIR = Path(os.getenv("BLS_CACHE_DIR", REPO_ROOT / ".cache" / "bls"))
+BLS_CACHE_TTL = float(os.getenv("BLS_CACHE_TTL_HOURS", "6")) * 3600  # chunks touching the fetch year
+BLS_CACHE_MAX_MB = float(os.getenv("BLS_CACHE_MAX_MB", "200"))
+BLS_OFFLINE = os.getenv("BLS_OFFLINE", "0") == "1"
+_cache_lock = threading.Lock()
+
+def bls_cache_key(ids, start_year, end_year) -> str:
+    norm = json.dumps({"seriesid": sorted(ids), "startyear": int(start_year), "endyear": int(end_year)}, sort_keys=True)
+    return hashlib.sha256(norm.encode()).hexdigest()
+
+def _cache_read(key: str, end_year: int, offline: bool):
+    path = BLS_CACHE_DIR / f"{key}.json"
+    try:
+        entry = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    fetched = entry["fetched_at"]
+    # Years already closed when fetched are immutable; anything touching the fetch year expires
+    closed = end_year < dt.datetime.fromtimestamp(fetched).year
+    if not (offline or closed or time.time() - fetched < BLS_CACHE_TTL):
+        return None
+    os.utime(path)  # LRU: mtime doubles as last-access time
+    return entry["series"]
+
+def _cache_write(key: str, series) -> None:
+    with _cache_lock:
+        BLS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = BLS_CACHE_DIR / f"{key}.tmp"
+        tmp.write_text(json.dumps({"fetched_at": time.time(), "series": series}))
+        os.replace(tmp, BLS_CACHE_DIR / f"{key}.json")
+        _cache_evict()
+
+def _cache_evict() -> None:
+    files = sorted(BLS_CACHE_DIR.glob("*.json"), key=lambda f: f.stat().st_mtime)
+    total = sum(f.stat().st_size for f in files)
+    limit = BLS_CACHE_MAX_MB * 1024 * 1024
+    while files and total > limit:
+        f = files.pop(0)
+        total -= f.stat().st_size
+        f.unlink(missing_ok=True)
+
+_session = None
+_session_lock = threading.Lock()
+
+def bls_session() -> requests.Session:
+    # One pooled session shared by all fetch threads
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(BLS_WORKERS, 1))
+            _session.mount("https://", adapter)
+        return _session
+
+def bls_chunks(series_ids, start_year: int, end_year: int, max_series: int, max_years: int):
+    ids = list(dict.fromkeys(series_ids))
+    chunks = []
+    for i in range(0, len(ids), max_series):
+        for y in range(start_year, end_year + 1, max_years):
+            chunks.append((ids[i:i + max_series], y, min(y + max_years - 1, end_year)))
+    return chunks
+
+def _bls_chunk(ids, start_year, end_year, timeout, offline):
+    key = bls_cache_key(ids, start_year, end_year)
+    if BLS_CACHE or offline:
+        cached = _cache_read(key, end_year, offline)
+        if cached is not None:
+            metrics.count("bls_cache_hits")
+            return cached
+    if offline:
+        raise RuntimeError(f"BLS offline: no cached response for {len(ids)} series {start_year}-{end_year}")
+    metrics.count("bls_cache_misses")
+    series = _bls_post(ids, start_year, end_year, timeout)
+    if BLS_CACHE:
+        _cache_write(key, series)
+    return series
+
+def _bls_post(ids, start_year, end_year, timeout):
+    payload = {"seriesid": ids, "startyear": str(start_year), "endyear": str(end_year)}
     if BLS_API_KEY:
         payload["registrationkey"] = BLS_API_KEY
-    r = requests.post("https://api.bls.gov/publicAPI/v2/timeseries/data/", json=payload, timeout=timeout)
-    r.raise_for_status()
+    for attempt in range(BLS_RETRIES + 1):
+        try:
+            metrics.count("http_requests")
+            _quota_spend()
+            with metrics.timed("http_s"):
+                r = bls_session().post(BLS_URL, json=payload, timeout=timeout)
+            metrics.count("http_bytes", len(r.content))
+            if r.status_code in RETRY_STATUS and attempt < BLS_RETRIES:
+                raise requests.HTTPError(f"HTTP {r.status_code}", response=r)
+            r.raise_for_status()
+            break
+        except (requests.Timeout, requests.ConnectionError, requests.HTTPError) as e:
+            retryable = not isinstance(e, requests.HTTPError) or e.response.status_code in RETRY_STATUS
+            if not retryable or attempt >= BLS_RETRIES:
+                raise
+            wait = BLS_BACKOFF * 2 ** attempt
+            print(f"BLS {start_year}-{end_year} ({len(ids)} series): {e}; retrying in {wait:.1f}s")
+            metrics.count("http_retries")
+            time.sleep(wait)
     j = r.json()
     if j.get("status") != "REQUEST_SUCCEEDED":
         raise RuntimeError(f"BLS API error: {j}")
     return j["Results"]["series"]
 
+def bls_request(ids, start_year: int, end_year: int, timeout=60, offline=None):
+    # One request as planned by the caller (cache, offline replay and retries still apply)
+    offline = BLS_OFFLINE if offline is None else offline
+    return _bls_chunk(list(ids), start_year, end_year, timeout, offline)
+
+def bls_fetch(series_ids, start_year=2000, end_year=None, timeout=60, workers=None, offline=None):
+    # Split into per-request limits, fetch concurrently, then merge chunks back per series.
+    # offline=True serves strictly from the disk cache and fails on a miss.
+    offline = BLS_OFFLINE if offline is None else offline
+    this_year = dt.date.today().year
+    end_year = min(end_year or this_year, this_year)
+    if start_year > end_year:
+        return []
+    max_series, max_years = bls_limits()
+    chunks = bls_chunks(series_ids, start_year, end_year, max_series, max_years)
+    workers = max(1, min(workers or BLS_WORKERS, len(chunks)))
+    metrics.count("bls_chunks", len(chunks))
+
+    merged = {sid: {"seriesID": sid, "data": []} for ids, _, _ in chunks for sid in ids}
+    fetch = metrics.bind(_bls_chunk)
+    with metrics.timed("bls_fetch_s"), ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fetch, ids, sy, ey, timeout, offline) for ids, sy, ey in chunks]
+        for fut in futures:
+            for s in fut.result():
+                merged.setdefault(s["seriesID"], {"seriesID": s["seriesID"], "data": []})["data"].extend(s.get("data", []))
+    # BLS returns newest first; keep that order across chunk boundaries
+    for s in merged.values():
+        s["data"].sort(key=lambda d: (d["year"], d["period"]), reverse=True)
+    return list(merged.values())
+
 # ---------------- DB ----------------
 REQ_VARS = ["PGHOST", "PGPORT", "PGDATABASE", "PGUSER", "PGPASSWORD"]
 
@@ -50,28 +279,187 @@ def get_engine():
             url += ("&" if "?" in url else "?") + "sslmode=require"
     else:
         url = _build_url_from_pg_env()
-    return create_engine(url, pool_pre_ping=True)
+    engine = create_engine(url, pool_pre_ping=True)
+    metrics.instrument_engine(engine)
+    return engine
+
+def db_configured() -> bool:
+    return bool(os.getenv("DATABASE_URL", "").strip()) or all(os.getenv(k) for k in REQ_VARS)
 
 def assert_connect(engine=None) -> None:
     eng = engine or get_engine()
     with eng.connect() as c:
         c.execute(text("select 1"))
 
-def upsert(engine, table: str, df: pd.DataFrame, pkeys: list[str]) -> None:
-    if df.empty:
-        print(f"{table}: no rows to load")
+def bump_data_version(engine, tables: list[str]) -> None:
+    # One row per table (created by etl/schema.py); the dashboard keys its caches on these
+    if not tables:
         return
     with engine.begin() as conn:
-        df.to_sql("_staging", conn, if_exists="replace", index=False)
-        cols = list(df.columns)
+        for t in tables:
+            conn.execute(text("""
+                insert into etl_data_version (table_name, version) values (:t, 1)
+                on conflict (table_name) do update
+                set version = etl_data_version.version + 1, loaded_at = now()
+            """), {"t": t})
+            conn.execute(text("select pg_notify('etl_data_version', :t)"), {"t": t})
+    print(f"Bumped data version: {', '.join(tables)}")
+
+def ensure_year_partitions(engine, table: str, years) -> None:
+    # Range-partitioned tables (partition by range (period_date)) get <table>_y<YYYY> on demand
+    with engine.begin() as conn:
+        for y in sorted(set(int(y) for y in years)):
+            conn.execute(text(f"create table if not exists {table}_y{y} partition of {table} "
+                              f"for values from ('{y}-01-01') to ('{y + 1}-01-01')"))
+
+# ---------------- Incremental ----------------
+# BLS revises the most recent months, so incremental runs always refetch a trailing window
+REVISION_MONTHS = int(os.getenv("BLS_REVISION_MONTHS", "13"))
+
+def _db_latest(table: str) -> dt.date | None:
+    if not db_configured():
+        return None
+    try:
+        with get_engine().connect() as c:
+            val = c.execute(text(f"select max(period_date) from {table}")).scalar()
+    except Exception as e:
+        print(f"{table}: could not read watermark ({e})")
+        return None
+    return pd.Timestamp(val).date() if val is not None else None
+
+def _store_latest(dataset: str) -> dt.date | None:
+    df = read_dataset(dataset, columns=["period_date"])
+    return df["period_date"].max().date() if df is not None and not df.empty else None
+
+def latest_period(dataset: str, table: str) -> dt.date | None:
+    # Newest period_date stored: the intermediate store (or its CSV seed) or the DB table,
+    # whichever is newer. A fresh runner has only the committed CSV seed, which lags the DB.
+    marks = [m for m in (_store_latest(dataset), _db_latest(table)) if m is not None]
+    return max(marks) if marks else None
+
+def read_existing(dataset: str, table: str) -> pd.DataFrame | None:
+    # Full stored dataset from the same source latest_period picks: the store, unless the DB
+    # table is newer (or the store is empty). A failed DB read raises: the caller has already
+    # narrowed its fetch to the watermark, so going on without these rows would truncate history.
+    df = read_dataset(dataset)
+    store = df["period_date"].max().date() if df is not None and not df.empty else None
+    db = _db_latest(table)
+    if db is None or (store is not None and store >= db):
+        return df
+    with get_engine().connect() as c:
+        df = pd.read_sql(text(f"select * from {table}"), c)
+    print(f"{table}: database is newer than the store ({db} > {store}); using its rows")
+    df["period_date"] = pd.to_datetime(df["period_date"])
+    return df.drop(columns=["ym"], errors="ignore")
+
+def revision_start_year(watermark: dt.date, months: int = REVISION_MONTHS) -> int:
+    return (pd.Timestamp(watermark) - pd.DateOffset(months=months)).year
+
+def merge_incremental(existing: pd.DataFrame, fresh: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    # Fresh rows win on key collisions so BLS revisions overwrite stale values
+    both = pd.concat([existing, fresh], ignore_index=True)
+    return both.drop_duplicates(subset=keys, keep="last")
+
+def changed_rows(engine, table: str, df: pd.DataFrame, pkeys: list[str], within: list[str] | None = None) -> pd.DataFrame:
+    # Diff against the stored key range so only new or changed rows reach upsert. within: key
+    # columns whose values in df also bound the stored rows read (e.g. ticker)
+    if df.empty:
+        return df
+    with metrics.timed("diff_s"):
+        return _changed_rows(engine, table, df, pkeys, within or [])
+
+def _changed_rows(engine, table, df, pkeys, within):
+    cols = list(df.columns)
+    conds, params = [], {}
+    if "period_date" in pkeys:
+        conds.append("period_date between :lo and :hi")
+        params = {"lo": df["period_date"].min().date(), "hi": df["period_date"].max().date()}
+    for col in within:
+        conds.append(f"{col} = any(:{col})")
+        params[col] = df[col].astype(str).unique().tolist()
+    where = f"where {' and '.join(conds)}" if conds else ""
+    with engine.connect() as c:
+        cur = pd.read_sql(text(f"select {', '.join(cols)} from {table} {where}"), c, params=params)
+    if "period_date" in cols:
+        cur["period_date"] = pd.to_datetime(cur["period_date"])
+
+    merged = df.merge(cur, on=pkeys, how="left", suffixes=("", "__db"), indicator=True)
+    is_new = (merged["_merge"] == "left_only").to_numpy()
+    differs = np.zeros(len(merged), dtype=bool)
+    for col in (c for c in cols if c not in pkeys):
+        a, b = merged[col], merged[f"{col}__db"]
+        if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+            same = np.isclose(a.to_numpy(float), b.to_numpy(float), rtol=1e-12, atol=0.0, equal_nan=True)
+        else:
+            same = ((a == b) | (a.isna() & b.isna())).to_numpy()
+        differs |= ~same
+    is_changed = differs & ~is_new
+    unchanged = len(merged) - is_new.sum() - is_changed.sum()
+    print(f"{table}: {is_new.sum()} new, {is_changed.sum()} changed, {unchanged} unchanged")
+    metrics.count("db_rows_in", len(merged))
+    metrics.count("db_rows_unchanged", int(unchanged))
+    return merged.loc[is_new | is_changed, cols].reset_index(drop=True)
+
+UPSERT_CHUNK_ROWS = int(os.getenv("UPSERT_CHUNK_ROWS", "100000"))
+
+def _iter_chunks(df, chunksize: int):
+    # Accept one DataFrame or any iterable of them (e.g. pd.read_csv(..., chunksize=n))
+    if isinstance(df, pd.DataFrame):
+        for i in range(0, len(df), chunksize):
+            yield df.iloc[i:i + chunksize]
+    else:
+        yield from df
+
+def upsert(engine, table: str, df, pkeys: list[str], chunksize: int = UPSERT_CHUNK_ROWS) -> dict:
+    # COPY into a session-scoped TEMP table typed like the target, then merge with ON CONFLICT.
+    # TEMP tables are private to the connection, so concurrent loads never collide.
+    counts = {"inserted": 0, "updated": 0}
+    staging = f"_staging_{table}"
+    cols = None
+    with metrics.timed("upsert_s"), engine.begin() as conn:
+        cur = conn.connection.cursor()
+        for chunk in _iter_chunks(df, chunksize):
+            if chunk.empty:
+                continue
+            if cols is None:
+                cols = list(chunk.columns)
+                cur.execute(f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+            buf = io.StringIO()
+            chunk[cols].to_csv(buf, index=False, header=False, date_format="%Y-%m-%d")
+            metrics.count("copy_bytes", buf.tell())
+            buf.seek(0)
+            cur.copy_expert(f"COPY {staging} ({', '.join(cols)}) FROM STDIN WITH (FORMAT csv)", buf)
+        if cols is None:
+            print(f"{table}: no rows to load")
+            return counts
         set_cols = [c for c in cols if c not in pkeys]
-        set_clause = ", ".join([f"{c}=EXCLUDED.{c}" for c in set_cols]) or "nothing"
         collist = ", ".join(cols)
         pkeylist = ", ".join(pkeys)
-        conn.execute(text(f"""
-            INSERT INTO {table} ({collist})
-            SELECT {collist} FROM _staging
-            ON CONFLICT ({pkeylist}) DO UPDATE SET {set_clause};
-        """))
-        conn.execute(text("DROP TABLE _staging"))
-    print(f"Upserted {len(df)} rows into {table}")
\ No newline at end of file
+        action = "DO NOTHING"
+        if set_cols:
+            # Rows identical to the stored ones are skipped, so "updated" counts real changes
+            action = ("DO UPDATE SET " + ", ".join(f"{c}=EXCLUDED.{c}" for c in set_cols)
+                      + f" WHERE ({', '.join(f'{table}.{c}' for c in set_cols)})"
+                      + f" IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in set_cols)})")
+        merge = f"INSERT INTO {table} ({collist}) SELECT {collist} FROM {staging} ON CONFLICT ({pkeylist}) {action}"
+        cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass", (table,))
+        if cur.fetchone()[0]:
+            # Partitioned tables cannot return xmax: count the keys already stored instead
+            cur.execute(f"SELECT count(*), count(t.{pkeys[0]}) FROM {staging} s LEFT JOIN {table} t USING ({pkeylist})")
+            staged, stored = cur.fetchone()
+            cur.execute(merge)
+            counts["inserted"] = staged - stored
+            counts["updated"] = cur.rowcount - counts["inserted"]
+        else:
+            # xmax = 0 only for freshly inserted tuples
+            cur.execute(f"""
+                WITH merged AS ({merge} RETURNING (xmax = 0) AS inserted)
+                SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+            """)
+            counts["inserted"], counts["updated"] = cur.fetchone()
+        cur.close()
+    metrics.count("db_inserted", counts["inserted"])
+    metrics.count("db_updated", counts["updated"])
+    print(f"Upserted {counts['inserted'] + counts['updated']} rows into {table} "
+          f"({counts['inserted']} inserted, {counts['updated']} updated)")
+    return counts
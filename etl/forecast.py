@@ -0,0 +1,231 @@
+import os
+import json
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+import arima
+import backend
+from common import get_engine, changed_rows, upsert, bump_data_version, REVISION_MONTHS
+from schema import migrate
+from store import DATA_DIR, write_dataset, content_hash, stored_hash
+import metrics
+
+# Forecasts for the headline unemployment rate and the employment of every CES supersector and
+# detailed industry (mv_ces_industry, once the catalog is loaded). Run after the load
+# (python -m etl run, stage "forecast") and written to the forecasts table, so the dashboard
+# only reads them. Model: ARIMA(p,1,0) with drift (etl/arima.py), employment in logs,
+# intervals from bootstrapped residual paths. Fits run on a process pool; fitted models and
+# their forecasts are cached per series, keyed on a hash of the series' data:
+#   unchanged series                      -> cached forecast reused (skip)
+#   only the trailing REVISION_MONTHS revised or appended, model younger than REFIT_MONTHS
+#                                         -> cached coefficients, new forecast (warm)
+#   anything older changed, or new series -> refit
+DATASET = "forecasts"
+TABLE = "forecasts"
+HORIZON = int(os.getenv("FORECAST_HORIZON", "12"))            # months ahead
+FIT_MONTHS = int(os.getenv("FORECAST_FIT_MONTHS", "240"))     # trailing months each fit sees
+MIN_MONTHS = 36                                               # shorter series are not forecast
+PATHS = int(os.getenv("FORECAST_PATHS", "2000"))              # bootstrap paths for the intervals
+REFIT_MONTHS = int(os.getenv("FORECAST_REFIT_MONTHS", "12"))  # months of new data before a forced refit
+WORKERS = int(os.getenv("FORECAST_WORKERS", str(os.cpu_count() or 1)))
+SERIES_PER_WORKER = 200  # a fit takes a few ms, a spawned worker about a second to start
+CHUNK = 16  # series per pool task
+MODEL = "arima_p10"
+CACHE_PATH = DATA_DIR / ".forecast_cache.json"
+
+# Anything that changes what a fit produces; a different config starts an empty cache
+CONFIG = {"model": MODEL, "horizon": HORIZON, "fit_months": FIT_MONTHS, "max_lag": arima.MAX_LAG,
+          "paths": PATHS, "revision_months": REVISION_MONTHS}
+
+# ---------------- Series ----------------
+
+def load_series() -> list[dict]:
+    # Month-keyed rollups from the configured backend: one dict per series, oldest month first
+    un = backend.query("select ym, unemployment_rate from mv_unemployment order by ym")
+    sec = backend.query("""select ym, sector_code, sector_name, employment_thousands
+                           from mv_employment_sector order by sector_code, ym""")
+    ind = backend.query("""select ym, sector_code, sector_name, employment_thousands
+                           from mv_ces_industry order by sector_code, ym""")
+    series = [("unemployment_rate", "Unemployment rate", False, un.dropna(), "unemployment_rate")]
+    seen = set()
+    for df in (sec.dropna(subset=["employment_thousands"]), ind.dropna(subset=["employment_thousands"])):
+        for code, g in df.groupby("sector_code", sort=True):
+            if code not in seen:  # CES series ids: a supersector's total is also in the catalog
+                seen.add(code)
+                series.append((f"ces:{code}", g["sector_name"].iloc[-1], True, g, "employment_thousands"))
+    out = []
+    for key, name, log, df, col in series:
+        if len(df) < MIN_MONTHS:
+            print(f"forecast: {key} has {len(df)} months (< {MIN_MONTHS}); skipping")
+            continue
+        ym = df["ym"].to_numpy().astype("datetime64[M]")
+        out.append({"key": key, "name": name, "log": log, "ym": ym, "y": df[col].to_numpy(float)})
+    return out
+
+def _digest(ym: np.ndarray, y: np.ndarray) -> str:
+    h = hashlib.sha256(ym.astype(np.int64).tobytes())
+    h.update(np.round(y, 9).tobytes())
+    return h.hexdigest()[:16]
+
+def _seed(key: str) -> int:
+    # Same data, same intervals: unchanged inputs never show up as changed rows
+    return int(hashlib.sha256(key.encode()).hexdigest()[:8], 16)
+
+# ---------------- Cache ----------------
+
+def _read_cache() -> dict:
+    try:
+        cache = json.loads(CACHE_PATH.read_text())
+    except (OSError, ValueError):
+        return {}
+    return cache["series"] if cache.get("config") == CONFIG else {}
+
+def _write_cache(entries: dict) -> None:
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CACHE_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"config": CONFIG, "series": entries}))
+    os.replace(tmp, CACHE_PATH)
+
+def _stable(s: dict, through: np.datetime64) -> str:
+    keep = s["ym"] <= through
+    return _digest(s["ym"][keep], s["y"][keep])
+
+def plan(s: dict, entry: dict | None) -> str:
+    if entry is None:
+        return "refit"
+    if entry["digest"] == _digest(s["ym"], s["y"]):
+        return "skip"
+    last, fitted = s["ym"][-1], np.datetime64(entry["fitted_through"], "M")
+    if _stable(s, np.datetime64(entry["stable_through"], "M")) != entry["stable"]:
+        return "refit"  # history older than the revision window changed
+    if not 0 <= (last - fitted).astype(int) < REFIT_MONTHS:
+        return "refit"
+    return "warm"
+
+# ---------------- Fit ----------------
+
+def _task(s: dict, model: dict | None) -> dict:
+    return {"key": s["key"], "y": s["y"], "log": s["log"], "model": model, "horizon": HORIZON,
+            "paths": PATHS, "fit_months": FIT_MONTHS, "max_lag": arima.MAX_LAG, "seed": _seed(s["key"])}
+
+def _pool_size(n: int, workers: int) -> int:
+    return max(1, min(workers, -(-n // SERIES_PER_WORKER)))
+
+def run_tasks(tasks: list[dict], workers: int = WORKERS) -> list[dict]:
+    # Chunks of series on a process pool, one worker per SERIES_PER_WORKER series; inline below
+    # that. Workers are spawned, not forked: the pipeline runs stages on threads, and forking a
+    # threaded process is unsafe.
+    chunks = [tasks[i:i + CHUNK] for i in range(0, len(tasks), CHUNK)]
+    if workers == 1 or _pool_size(len(tasks), workers) == 1:
+        return [r for c in chunks for r in arima.forecast_chunk(c)]
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=_pool_size(len(tasks), workers), mp_context=ctx) as pool:
+        return [r for rs in pool.map(arima.forecast_chunk, chunks) for r in rs]
+
+def _frame(series: list[dict], entries: dict) -> pd.DataFrame:
+    # HORIZON rows per series, built column-wise (one DataFrame, not one per series)
+    es = [entries[s["key"]] for s in series]
+    first = np.array([e["last_actual"] for e in es], dtype="datetime64[M]") + 1
+    def rep(values):
+        return np.repeat(np.asarray(values), HORIZON)
+    return pd.DataFrame({
+        "period_date": (rep(first) + np.tile(np.arange(HORIZON), len(es))).astype("datetime64[ns]"),
+        "series_key": pd.Categorical(rep([s["key"] for s in series])),
+        "series_name": pd.Categorical(rep([s["name"] for s in series])),
+        **{b: np.concatenate([e["bands"][b] for e in es]) for b in ("value", "lo80", "hi80", "lo95", "hi95")},
+        "model": pd.Categorical(rep([f"{MODEL}(p={e['model']['p']})" for e in es])),
+        "last_actual": rep(np.array([e["last_actual"] for e in es], dtype="datetime64[M]")).astype("datetime64[ns]"),
+        "fitted_through": rep(np.array([e["fitted_through"] for e in es], dtype="datetime64[M]")).astype("datetime64[ns]"),
+    })
+
+def build(refit: bool = False, workers: int = WORKERS) -> pd.DataFrame | None:
+    if not backend.configured():
+        print("forecast: no backend configured (ETL_BACKEND / DATABASE_URL); skipping")
+        return None
+    series = load_series()
+    if not series:
+        return None
+    cache = {} if refit else _read_cache()
+    plans = {s["key"]: plan(s, cache.get(s["key"])) for s in series}
+    tasks = [_task(s, cache[s["key"]]["model"] if plans[s["key"]] == "warm" else None)
+             for s in series if plans[s["key"]] != "skip"]
+    with metrics.timed("forecast_fit_s"):
+        results = {r["key"]: r for r in run_tasks(tasks, workers)}
+
+    entries = {}
+    for s in series:
+        key = s["key"]
+        how, last = plans[key], str(s["ym"][-1])
+        if how == "skip":
+            entries[key] = cache[key]
+        elif how == "warm":
+            entries[key] = {**cache[key], "digest": _digest(s["ym"], s["y"]), "last_actual": last,
+                            "bands": results[key]["bands"]}
+        else:
+            through = s["ym"][-1] - REVISION_MONTHS
+            entries[key] = {"digest": _digest(s["ym"], s["y"]), "stable": _stable(s, through),
+                            "stable_through": str(through), "fitted_through": last, "last_actual": last,
+                            "model": results[key]["model"], "bands": results[key]["bands"]}
+    _write_cache(entries)
+
+    n = {h: list(plans.values()).count(h) for h in ("refit", "warm", "skip")}
+    metrics.count("forecast_series", len(series))
+    metrics.count("forecast_refit", n["refit"])
+    metrics.count("forecast_warm", n["warm"])
+    metrics.count("forecast_skipped", n["skip"])
+    print(f"forecast: {len(series)} series ({n['refit']} refit, {n['warm']} warm-started, "
+          f"{n['skip']} unchanged) on {_pool_size(len(tasks), workers)} worker(s)")
+    return _frame(series, entries)
+
+# ---------------- Publish ----------------
+
+def publish_postgres(df: pd.DataFrame) -> None:
+    engine = get_engine()
+    migrate(engine)
+    df = df.assign(last_actual=df["last_actual"].dt.date, fitted_through=df["fitted_through"].dt.date)
+    counts = upsert(engine, TABLE, changed_rows(engine, TABLE, df, ["series_key", "period_date"]),
+                    ["series_key", "period_date"])
+    # Rows from older forecast origins (months that are now actuals) and series no longer forecast
+    origins = df.drop_duplicates("series_key")
+    with engine.begin() as conn:
+        deleted = conn.execute(text("""
+            delete from forecasts f
+            where not exists (select 1 from unnest(:keys, :origins) as o(series_key, last_actual)
+                              where o.series_key = f.series_key and o.last_actual = f.last_actual)
+        """), {"keys": origins["series_key"].astype(str).tolist(), "origins": origins["last_actual"].tolist()}).rowcount
+    if deleted:
+        print(f"{TABLE}: deleted {deleted} stale rows")
+    if counts.get("inserted") or counts.get("updated") or deleted:
+        bump_data_version(engine, [TABLE])
+
+def publish(df: pd.DataFrame, csv: bool | None = None) -> None:
+    # Unchanged forecasts skip the write and the DuckDB reload
+    if csv or stored_hash(DATASET) != content_hash(DATASET, df):
+        path = write_dataset(DATASET, df, csv=csv)
+        print(f"Saved {path} ({df['series_key'].nunique()} series, {len(df)} rows)")
+        if backend.BACKEND == "duckdb":
+            backend.load_duckdb()  # the forecasts view only sees the new files after a reload
+    else:
+        print(f"{DATASET}: unchanged, not rewritten")
+    if backend.BACKEND != "duckdb":
+        publish_postgres(df)
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Forecast unemployment and sector employment")
+    ap.add_argument("--refit", action="store_true", help="ignore the fitted-model cache")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="fit processes")
+    ap.add_argument("--csv", action="store_true", default=None, help="also export a CSV")
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    df = build(refit=args.refit, workers=args.workers)
+    if df is not None:
+        publish(df, csv=args.csv)
+
+if __name__ == "__main__":
+    main()
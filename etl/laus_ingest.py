@@ -0,0 +1,239 @@
+import os
+import json
+import argparse
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import pandas as pd
+from sqlalchemy import text
+from common import (bls_request, bls_frame, bls_limits, bls_quota_left, get_engine, db_configured,
+                    upsert, changed_rows, revision_start_year, bump_data_version, ensure_year_partitions,
+                    BLS_WORKERS)
+from ces_catalog import read_flat, plan_requests, CATALOG_DIR, QUOTA_RESERVE
+from rollups import refresh_rollups
+from schema import migrate
+from store import DATA_DIR
+import metrics
+
+# Local Area Unemployment Statistics: state, metro and county series streamed straight into
+# the year-partitioned laus_observations table. Statewide series need no catalog; metro and
+# county series come from la.series / la.area (https://download.bls.gov/pub/time.series/la/)
+# in CES_CATALOG_DIR when present.
+DEFAULT_START = int(os.getenv("BLS_START_YEAR", "2000"))
+LAUS_START = 1976
+TABLE = "laus_observations"
+MEASURES = os.getenv("LAUS_MEASURES", "03,04,05,06")  # rate, unemployed, employed, labor force
+AREA_TYPES = os.getenv("LAUS_AREA_TYPES", "A,B,F")    # statewide, metro areas, counties
+BATCH_REQUESTS = int(os.getenv("LAUS_BATCH_REQUESTS", "20"))  # requests per COPY transaction
+STATE_PATH = DATA_DIR / ".laus_state.json"
+
+STATES = {
+    "01": ("AL", "Alabama"), "02": ("AK", "Alaska"), "04": ("AZ", "Arizona"), "05": ("AR", "Arkansas"),
+    "06": ("CA", "California"), "08": ("CO", "Colorado"), "09": ("CT", "Connecticut"),
+    "10": ("DE", "Delaware"), "11": ("DC", "District of Columbia"), "12": ("FL", "Florida"),
+    "13": ("GA", "Georgia"), "15": ("HI", "Hawaii"), "16": ("ID", "Idaho"), "17": ("IL", "Illinois"),
+    "18": ("IN", "Indiana"), "19": ("IA", "Iowa"), "20": ("KS", "Kansas"), "21": ("KY", "Kentucky"),
+    "22": ("LA", "Louisiana"), "23": ("ME", "Maine"), "24": ("MD", "Maryland"),
+    "25": ("MA", "Massachusetts"), "26": ("MI", "Michigan"), "27": ("MN", "Minnesota"),
+    "28": ("MS", "Mississippi"), "29": ("MO", "Missouri"), "30": ("MT", "Montana"),
+    "31": ("NE", "Nebraska"), "32": ("NV", "Nevada"), "33": ("NH", "New Hampshire"),
+    "34": ("NJ", "New Jersey"), "35": ("NM", "New Mexico"), "36": ("NY", "New York"),
+    "37": ("NC", "North Carolina"), "38": ("ND", "North Dakota"), "39": ("OH", "Ohio"),
+    "40": ("OK", "Oklahoma"), "41": ("OR", "Oregon"), "42": ("PA", "Pennsylvania"),
+    "44": ("RI", "Rhode Island"), "45": ("SC", "South Carolina"), "46": ("SD", "South Dakota"),
+    "47": ("TN", "Tennessee"), "48": ("TX", "Texas"), "49": ("UT", "Utah"), "50": ("VT", "Vermont"),
+    "51": ("VA", "Virginia"), "53": ("WA", "Washington"), "54": ("WV", "West Virginia"),
+    "55": ("WI", "Wisconsin"), "56": ("WY", "Wyoming"), "72": ("PR", "Puerto Rico"),
+}
+
+# ---------------- Series ----------------
+# LAUS series ids: "LA" + seasonal (S/U) + 15-char area code + 2-digit measure code
+
+def _split_ids(ids: pd.Series) -> pd.DataFrame:
+    return pd.DataFrame({"series_id": ids, "seasonal": ids.str[2], "area_code": ids.str[3:18],
+                         "measure_code": ids.str[18:20]})
+
+def state_series(measures: list[str]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # Statewide, seasonally adjusted: LASST060000000000003 is California's unemployment rate
+    areas = pd.DataFrame([{"area_code": f"ST{fips}00000000000", "area_type": "A", "area_text": name,
+                           "state_fips": fips, "state_abbr": abbr} for fips, (abbr, name) in STATES.items()])
+    ids = pd.Series([f"LAS{a}{m}" for a in areas["area_code"] for m in measures])
+    series = _split_ids(ids).assign(begin_year=LAUS_START, end_year=dt.date.today().year)
+    return series, areas
+
+def catalog_series(measures: list[str], area_types: list[str]) -> tuple[pd.DataFrame, pd.DataFrame] | None:
+    series = read_flat(CATALOG_DIR / "la.series")
+    if series is None:
+        return None
+    series = series[series["measure_code"].isin(measures) & series["area_type_code"].isin(area_types)]
+    fips = series.groupby("area_code")["srd_code"].first()
+    areas = read_flat(CATALOG_DIR / "la.area")
+    names = areas.set_index("area_code")["area_text"] if areas is not None else pd.Series(dtype=str)
+    area_df = pd.DataFrame({
+        "area_code": fips.index,
+        "area_type": series.groupby("area_code")["area_type_code"].first().reindex(fips.index).to_numpy(),
+        "area_text": names.reindex(fips.index).to_numpy(),
+        "state_fips": fips.to_numpy(),
+        "state_abbr": fips.map(lambda f: STATES.get(f, (None,))[0]).to_numpy(),
+    })
+    out = _split_ids(series["series_id"]).assign(begin_year=series["begin_year"].astype(int).to_numpy(),
+                                                  end_year=series["end_year"].astype(int).to_numpy())
+    return out, area_df
+
+def series_list(measures=MEASURES, area_types=AREA_TYPES) -> tuple[pd.DataFrame, pd.DataFrame]:
+    measures = [m.strip() for m in measures.split(",")]
+    area_types = [a.strip() for a in area_types.split(",")]
+    series, areas = state_series(measures)
+    cat = catalog_series(measures, area_types)
+    if cat is not None:
+        series = pd.concat([cat[0], series]).drop_duplicates("series_id")
+        areas = pd.concat([cat[1], areas]).drop_duplicates("area_code")
+    else:
+        print(f"LAUS: {CATALOG_DIR / 'la.series'} not found; statewide series only")
+    return series.reset_index(drop=True), areas.reset_index(drop=True)
+
+# ---------------- Planning ----------------
+
+def _watermarks(engine) -> pd.Series:
+    with engine.connect() as c:
+        df = pd.read_sql(text(f"select series_id, max(period_date) as last from {TABLE} group by 1"), c)
+    return pd.to_datetime(df.set_index("series_id")["last"])
+
+def _needs(engine, series, start_year, end_year, full) -> pd.DataFrame:
+    # Same rules as the CES catalog: stored series refetch the revision window, new series their
+    # history, discontinued ones (ended before the newest end year) stop at their end
+    start = series["begin_year"].clip(lower=start_year)
+    latest = series["end_year"].max()
+    last = None if full else _watermarks(engine)
+    if last is not None and not last.empty:
+        since = series["series_id"].map(last.map(revision_start_year))
+        start = since.fillna(start).clip(lower=start).astype(int)
+        done = series["series_id"].isin(last.index) & (series["end_year"] < latest)
+        series, start = series[~done], start[~done]
+    end = series["end_year"].where(series["end_year"] < latest, end_year).clip(upper=end_year)
+    need = pd.DataFrame({"series_id": series["series_id"], "start": start, "end": end})
+    return need[need["start"] <= need["end"]]
+
+def _read_state() -> dict | None:
+    try:
+        return json.loads(STATE_PATH.read_text())
+    except (OSError, ValueError):
+        return None
+
+def _write_state(state: dict) -> None:
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, STATE_PATH)
+
+def _new_plan(engine, series, start_year, end_year, full) -> dict:
+    max_series, max_years = bls_limits()
+    need = _needs(engine, series, start_year, end_year, full)
+    reqs = plan_requests(need, max_series, max_years, start_year) if not need.empty else []
+    state = {"created": dt.datetime.now().isoformat(timespec="seconds"), "requests": reqs, "done": []}
+    _write_state(state)
+    print(f"LAUS: planned {len(reqs)} requests for {len(need)} series")
+    return state
+
+# ---------------- Streaming load ----------------
+
+def _fetch(ids, sy, ey, offline) -> pd.DataFrame:
+    obs = bls_frame(bls_request(ids, sy, ey, offline=offline), freq=None)
+    obs = obs[(obs["freq"] == "M") & obs["value"].notna()]  # drop M13 annual averages quietly
+    df = _split_ids(obs["series_id"])
+    return df.assign(period_date=obs["period_date"], value=obs["value"], preliminary=obs["preliminary"])
+
+def _stream(state, batch, offline, loaded: list):
+    # Yield one parsed frame per request as responses arrive, with at most 2 x workers requests
+    # in flight, so memory stays bounded by the batch in flight, not by the number of series.
+    # Stops (without raising) on the first failed request or when the quota reserve is reached,
+    # so what arrived so far still commits.
+    fetch = metrics.bind(_fetch)
+    workers = max(1, BLS_WORKERS)
+    todo = iter(batch)
+    running = {}
+    stop = False
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            while not stop and len(running) < 2 * workers:
+                i = next(todo, None)
+                if i is None:
+                    break
+                if not offline and bls_quota_left() - len(running) <= QUOTA_RESERVE:
+                    print("LAUS: daily BLS quota reserve reached; resuming next run")
+                    stop = True
+                    break
+                running[pool.submit(fetch, *state["requests"][i], offline)] = i
+            if not running:
+                return
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                i = running.pop(fut)
+                try:
+                    df = fut.result()
+                except Exception as e:
+                    print(f"LAUS: request {i} failed ({e}); stopping")
+                    stop = True
+                    continue
+                loaded.append(i)
+                metrics.count("laus_requests")
+                yield df
+
+def run_plan(engine, state, offline=None, max_requests=None) -> int:
+    # Commit every BATCH_REQUESTS requests; progress is saved after each commit
+    pending = [i for i in range(len(state["requests"])) if i not in set(state["done"])]
+    if max_requests is not None:
+        pending = pending[:max_requests]
+    print(f"LAUS: {len(state['done'])}/{len(state['requests'])} requests done, {len(pending)} to try now")
+    changed = 0
+    for b in range(0, len(pending), BATCH_REQUESTS):
+        batch = pending[b:b + BATCH_REQUESTS]
+        ensure_year_partitions(engine, TABLE, [y for i in batch for y in range(state["requests"][i][1], state["requests"][i][2] + 1)])
+        loaded = []
+        counts = upsert(engine, TABLE, _stream(state, batch, offline, loaded), ["series_id", "period_date"])
+        changed += counts["inserted"] + counts["updated"]
+        state["done"] += loaded
+        _write_state(state)
+        if len(loaded) < len(batch):
+            break  # quota or a failed request: the rest waits for the next run
+    return changed
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Stream BLS LAUS state/metro/county series into Postgres")
+    ap.add_argument("start_year", nargs="?", type=int, default=DEFAULT_START)
+    ap.add_argument("end_year", nargs="?", type=int, default=dt.date.today().year)
+    ap.add_argument("--full", action="store_true", help="ignore stored months and plan whole histories")
+    ap.add_argument("--replan", action="store_true", help="discard the saved plan and progress")
+    ap.add_argument("--max-requests", type=int, default=None, help="cap on requests this run")
+    ap.add_argument("--measures", default=MEASURES, help="comma-separated LAUS measure codes")
+    ap.add_argument("--area-types", default=AREA_TYPES, help="comma-separated la.series area types")
+    ap.add_argument("--offline", action="store_true", help="replay BLS responses from the disk cache only")
+    return ap.parse_args(argv)
+
+def build(start_year=DEFAULT_START, end_year=None, full=False, offline=None, replan=False,
+          max_requests=None, measures=MEASURES, area_types=AREA_TYPES) -> int:
+    # Returns rows inserted or changed; there is no intermediate dataset for LAUS
+    if not db_configured():
+        print("LAUS: no database configured; skipping")
+        return 0
+    end_year = end_year or dt.date.today().year
+    engine = get_engine()
+    migrate(engine)
+    series, areas = series_list(measures, area_types)
+    upsert(engine, "laus_areas", changed_rows(engine, "laus_areas", areas, ["area_code"]), ["area_code"])
+
+    state = None if replan else _read_state()
+    if state is None or len(state["done"]) == len(state["requests"]):
+        state = _new_plan(engine, series, start_year, end_year, full)
+    changed = run_plan(engine, state, offline=offline, max_requests=max_requests)
+    if changed:
+        refresh_rollups(engine, names=["mv_laus_latest"])
+        bump_data_version(engine, [TABLE])
+    return changed
+
+def main(argv=None):
+    args = parse_args(argv)
+    build(args.start_year, args.end_year, full=args.full, offline=args.offline or None, replan=args.replan,
+          max_requests=args.max_requests, measures=args.measures, area_types=args.area_types)
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,124 @@
-import os
 import pandas as pd
-from common import get_engine, assert_connect, upsert
+from sqlalchemy import text
+from common import get_engine, assert_connect, upsert, changed_rows, bump_data_version, ensure_year_partitions
+from store import read_dataset
+from rollups import refresh_rollups, rollups_over
+from schema import migrate
+from ces_catalog import read_catalog
+import backend
+import metrics
 
-def load_equities(engine):
-    path = "equities_monthly.csv"
-    if not os.path.exists(path):
-        print("equities_monthly.csv not found; skipping")
-        return
-    df = pd.read_csv(path, parse_dates=["period_date"])
-    # enforce numeric types and drop bad rows
-    df["adj_close"] = pd.to_numeric(df["adj_close"], errors="coerce")
-    df["monthly_return"] = pd.to_numeric(df["monthly_return"], errors="coerce")
+def _frame(name, df):
+    # In-memory frame from the pipeline runner, else the intermediate store
+    df = read_dataset(name) if df is None else df
+    if df is None:
+        print(f"{name} dataset not found; skipping")
+    return df
+
+def load_equities(engine, df=None):
+    df = _frame("equities", df)
+    if df is None:
+        return {}
+    # drop bad rows
     df = df.dropna(subset=["adj_close"])
-    upsert(engine, "equities_monthly", df, ["period_date", "ticker"])
+    df = changed_rows(engine, "equities_monthly", df, ["period_date", "ticker"])
+    return upsert(engine, "equities_monthly", df, ["period_date", "ticker"])
 
-def load_unemployment(engine):
-    path = "bls_unemployment.csv"
-    if not os.path.exists(path):
-        print("bls_unemployment.csv not found; skipping")
-        return
-    df = pd.read_csv(path, parse_dates=["period_date"])
-    if "unemployment_rate" not in df and "value" in df.columns:
-        df = df.rename(columns={"value": "unemployment_rate"})
-    df = df[["period_date", "unemployment_rate"]]
-    df["unemployment_rate"] = pd.to_numeric(df["unemployment_rate"], errors="coerce")
+def _daily_behind(engine, df) -> bool:
+    # Stored closes older than this run's window never reached the table (e.g. a failed load)
+    with engine.connect() as c:
+        last = c.execute(text("select max(period_date) from equities_daily")).scalar()
+    first = df.groupby("ticker", observed=True)["period_date"].min()
+    return last is None or pd.Timestamp(last) < first.max()
+
+def load_equities_daily(engine, df=None):
+    # Optional: only present when stocks_ingest ran with --daily. From the pipeline, df holds
+    # only the closes this run fetched (the incremental window and full refreshes); each group
+    # of tickers with the same first date is diffed against just its own tickers and dates.
+    if df is not None and not df.empty and _daily_behind(engine, df):
+        print("equities_daily: table is behind the fetched window; diffing the whole dataset")
+        df = None
+    df = read_dataset("equities_daily") if df is None else df
+    if df is None or df.empty:
+        return {}
+    df = df.dropna(subset=["adj_close"])
+    first = df.groupby("ticker", observed=True)["period_date"].transform("min")
+    df = pd.concat([changed_rows(engine, "equities_daily", g, ["period_date", "ticker"], within=["ticker"])
+                    for _, g in df.groupby(first)], ignore_index=True)
+    ensure_year_partitions(engine, "equities_daily", pd.to_datetime(df["period_date"]).dt.year.unique())
+    return upsert(engine, "equities_daily", df, ["period_date", "ticker"])
+
+def load_unemployment(engine, df=None):
+    df = _frame("unemployment", df)
+    if df is None:
+        return {}
     df = df.dropna(subset=["unemployment_rate"])
-    upsert(engine, "unemployment_headline", df, ["period_date"])
+    df = changed_rows(engine, "unemployment_headline", df, ["period_date"])
+    return upsert(engine, "unemployment_headline", df, ["period_date"])
 
-def load_ces(engine):
-    path = "bls_ces_supersectors.csv"
-    if not os.path.exists(path):
-        print("bls_ces_supersectors.csv not found; skipping")
-        return
-    df = pd.read_csv(path, parse_dates=["period_date"])
-    df = df[["period_date", "sector_code", "sector_name", "employment_thousands"]]
-    df["employment_thousands"] = pd.to_numeric(df["employment_thousands"], errors="coerce")
+def load_ces(engine, df=None):
+    df = _frame("ces", df)
+    if df is None:
+        return {}
     df = df.dropna(subset=["employment_thousands"])
-    upsert(engine, "employment_sector", df, ["period_date", "sector_code"])
+    df = changed_rows(engine, "employment_sector", df, ["period_date", "sector_code"])
+    return upsert(engine, "employment_sector", df, ["period_date", "sector_code"])
 
-def main():
+def load_ces_catalog(engine, df=None):
+    df = _frame("ces_catalog", df)
+    if df is None:
+        return {}
+    cat = read_catalog()
+    if cat is not None:
+        series = changed_rows(engine, "ces_series", cat, ["series_id"])
+        upsert(engine, "ces_series", series, ["series_id"])
+    df = df.dropna(subset=["value"])
+    df = changed_rows(engine, "ces_observations", df, ["series_id", "period_date"])
+    return upsert(engine, "ces_observations", df, ["series_id", "period_date"])
+
+def load_catalog(df=None):
+    # The CES catalog on its own (pipeline stage load_catalog): its quota-limited fetch never
+    # holds up the headline load
+    if backend.BACKEND == "duckdb":
+        backend.load_duckdb()
+        return
+    engine = get_engine()
+    assert_connect(engine)
+    migrate(engine)
+    counts = load_ces_catalog(engine, df)
+    changed = bool(counts.get("inserted") or counts.get("updated"))
+    with metrics.timed("rollups_s"):
+        refresh_rollups(engine, changed=changed, names=["mv_ces_industry"])
+    if changed:
+        bump_data_version(engine, ["ces_observations"])
+
+def main(frames: dict | None = None, catalog: bool = True):
+    # catalog=False leaves ces_catalog to load_catalog (the pipeline's load stage)
+    if backend.BACKEND == "duckdb":
+        # Views over the store's datasets (already checkpointed by the pipeline), no upserts
+        backend.load_duckdb()
+        return
+    frames = frames or {}
     engine = get_engine()
     assert_connect(engine)
-    load_equities(engine)
-    load_unemployment(engine)
-    load_ces(engine)
+    with metrics.timed("migrate_s"):
+        migrate(engine)
+    counts = {
+        "equities_monthly": load_equities(engine, frames.get("equities")),
+        "equities_daily": load_equities_daily(engine, frames.get("equities_daily")),
+        "unemployment_headline": load_unemployment(engine, frames.get("unemployment")),
+        "employment_sector": load_ces(engine, frames.get("ces")),
+    }
+    if catalog:
+        counts["ces_observations"] = load_ces_catalog(engine, frames.get("ces_catalog"))
+    changed = [t for t, c in counts.items() if c.get("inserted") or c.get("updated")]
+    with metrics.timed("rollups_s"):
+        # Views over the tables loaded here: created if missing, refreshed if their tables changed
+        stale = rollups_over(changed)
+        refresh_rollups(engine, changed=False, names=[n for n in rollups_over(counts) if n not in stale])
+        refresh_rollups(engine, names=stale)
+    bump_data_version(engine, changed)
     print("Done")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,209 @@
+import os
+import io
+import json
+import time
+import threading
+import contextvars
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from sqlalchemy import event, text
+from store import DATA_DIR
+
+# Per-stage counters and timers for pipeline runs. The runner opens a stage per DAG node;
+# common.py and the ingest scripts record into whichever stage is current in their thread
+# (a no-op outside a run, e.g. when a script is run directly).
+RUNS_DIR = DATA_DIR / "runs"
+TOP_N = 15
+
+_current = contextvars.ContextVar("etl_stage", default=None)
+
+class Stage:
+    def __init__(self, name: str):
+        self.name = name
+        self.status = "running"
+        self.started = time.time()
+        self.seconds = 0.0
+        self.counters = {}
+        self.timings = {}
+        self.extra = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, n=1) -> None:
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def add_time(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self.timings[key] = self.timings.get(key, 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "seconds": round(self.seconds, 3),
+            "counters": dict(sorted(self.counters.items())),
+            "timings": {k: round(v, 3) for k, v in sorted(self.timings.items())},
+            **self.extra,
+        }
+
+# ---------------- Recording ----------------
+
+def count(key: str, n=1) -> None:
+    s = _current.get()
+    if s is not None:
+        s.add(key, n)
+
+def note(key: str, value) -> None:
+    # Free-form detail for the stage's entry in the run report (e.g. tickers that failed)
+    s = _current.get()
+    if s is not None:
+        with s._lock:
+            s.extra[key] = value
+
+@contextmanager
+def timed(key: str):
+    # Wall time of the block, summed per key (so per-chunk timings add up per stage)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        s = _current.get()
+        if s is not None:
+            s.add_time(key, time.perf_counter() - t0)
+
+def bind(fn):
+    # Pool threads do not inherit context: pool.submit(metrics.bind(fn), ...) records into
+    # the submitting thread's stage
+    stage = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(stage)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+def instrument_engine(engine) -> None:
+    # Count and time every statement the engine executes (raw COPY cursors are timed by upsert)
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        t0 = conn.info["query_t0"].pop()
+        s = _current.get()
+        if s is not None:
+            s.add("db_queries")
+            s.add_time("db_query_s", time.perf_counter() - t0)
+
+# ---------------- Runs ----------------
+
+def _top_functions(prof: cProfile.Profile) -> list[dict]:
+    stats = pstats.Stats(prof, stream=io.StringIO())
+    rows = sorted(stats.stats.items(), key=lambda kv: kv[1][3], reverse=True)[:TOP_N]
+    return [{"function": f"{fn}:{line}({name})", "calls": nc, "tottime": round(tt, 4), "cumtime": round(ct, 4)}
+            for (fn, line, name), (cc, nc, tt, ct, callers) in rows]
+
+def _top_allocations(snapshot) -> list[dict]:
+    return [{"site": str(st.traceback[0]), "kb": round(st.size / 1024, 1), "blocks": st.count}
+            for st in snapshot.statistics("lineno")[:TOP_N]]
+
+class Run:
+    # One pipeline execution. profile=True runs cProfile per stage (dumped next to the report
+    # as <run_id>.<stage>.prof); trace_memory=True records tracemalloc peaks and top allocation
+    # sites. Both are process-wide, so the runner executes stages one at a time when either is on.
+    def __init__(self, args: dict | None = None, profile: bool = False, trace_memory: bool = False):
+        self.run_id = time.strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}"
+        self.args = args or {}
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.started = time.time()
+        self.stages = {}
+        if trace_memory:
+            tracemalloc.start()
+
+    @property
+    def serial(self) -> bool:
+        return self.profile or self.trace_memory
+
+    @contextmanager
+    def stage(self, name: str):
+        s = self.stages[name] = Stage(name)
+        token = _current.set(s)
+        prof = cProfile.Profile() if self.profile else None
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        if prof:
+            prof.enable()
+        try:
+            yield s
+            s.status = "ok"
+        except BaseException:
+            s.status = "failed"
+            raise
+        finally:
+            if prof:
+                prof.disable()
+            s.seconds = time.perf_counter() - t0
+            if prof:
+                RUNS_DIR.mkdir(parents=True, exist_ok=True)
+                prof.dump_stats(RUNS_DIR / f"{self.run_id}.{name}.prof")
+                s.extra["profile"] = _top_functions(prof)
+            if self.trace_memory:
+                s.extra["memory_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+                s.extra["memory_top"] = _top_allocations(tracemalloc.take_snapshot())
+            _current.reset(token)
+
+    def report(self, ok: bool) -> dict:
+        return {
+            "run_id": self.run_id,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "seconds": round(time.time() - self.started, 3),
+            "ok": ok,
+            "args": self.args,
+            "stages": {name: s.as_dict() for name, s in self.stages.items()},
+        }
+
+    def finish(self, ok: bool) -> dict:
+        if self.trace_memory:
+            tracemalloc.stop()
+        rep = self.report(ok)
+        RUNS_DIR.mkdir(parents=True, exist_ok=True)
+        path = RUNS_DIR / f"{self.run_id}.json"
+        path.write_text(json.dumps(rep, indent=2, default=str))
+        print(f"Run report: {path}")
+        for name, st in rep["stages"].items():
+            c = st["counters"]
+            print(f"  {name:<14} {st['status']:<7} {st['seconds']:>7.1f}s  rows_out={c.get('rows_out', '-')}"
+                  f"  http={c.get('http_requests', 0)} req/{c.get('http_bytes', 0) / 1024:.0f} KiB"
+                  f"  db={c.get('db_inserted', 0) + c.get('db_updated', 0)} rows")
+        return rep
+
+def save_history(engine, rep: dict) -> None:
+    # etl_run_history / etl_stage_history are created by etl/schema.py
+    with engine.begin() as conn:
+        conn.execute(text("""
+            insert into etl_run_history (run_id, started_at, seconds, ok, report)
+            values (:id, :started, :seconds, :ok, cast(:report as jsonb))
+            on conflict (run_id) do nothing
+        """), {"id": rep["run_id"], "started": rep["started"], "seconds": rep["seconds"],
+               "ok": rep["ok"], "report": json.dumps(rep, default=str)})
+        for name, st in rep["stages"].items():
+            c = st["counters"]
+            conn.execute(text("""
+                insert into etl_stage_history
+                    (run_id, stage, status, seconds, rows_out, http_requests, http_bytes, db_rows, metrics)
+                values (:id, :stage, :status, :seconds, :rows_out, :http_requests, :http_bytes, :db_rows,
+                        cast(:metrics as jsonb))
+                on conflict (run_id, stage) do nothing
+            """), {"id": rep["run_id"], "stage": name, "status": st["status"], "seconds": st["seconds"],
+                   "rows_out": c.get("rows_out"), "http_requests": c.get("http_requests", 0),
+                   "http_bytes": c.get("http_bytes", 0),
+                   "db_rows": c.get("db_inserted", 0) + c.get("db_updated", 0),
+                   "metrics": json.dumps({"counters": c, "timings": st["timings"]})})
+    print(f"Saved run {rep['run_id']} to etl_run_history")
@@ -0,0 +1,189 @@
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import bls_ingest
+import bls_ces_ingest
+import ces_catalog
+import laus_ingest
+import stocks_ingest
+import load_to_db
+import forecast
+import metrics
+from common import db_configured, get_engine
+from schema import migrate
+from store import DATA_DIR, read_dataset, write_dataset
+
+# Usage: python -m etl run [--only a,b] [--skip c] [--resume] [--full] [--offline] [--csv] [--profile] [--trace-memory]
+STATE_PATH = DATA_DIR / ".pipeline_state.json"
+
+# ---------------- Stages ----------------
+# Each stage gets the CLI args and the in-memory outputs of its dependencies.
+# Stages with a dataset also checkpoint it to the store so --resume/--only can reuse it.
+# A stage may return (frame, {name: frame}) to also hand extra in-memory frames downstream;
+# only the first is checkpointed.
+
+def _bls_headline(args, inputs):
+    return bls_ingest.build(args.start_year, args.end_year, full=args.full, offline=args.offline or None)
+
+def _bls_ces(args, inputs):
+    return bls_ces_ingest.build(args.start_year, args.end_year, full=args.full, offline=args.offline or None)
+
+def _ces_catalog(args, inputs):
+    # Quota-limited: each run does what today's BLS quota allows and resumes next time
+    return ces_catalog.build(args.start_year, args.end_year, full=args.full, offline=args.offline or None)
+
+def _laus(args, inputs):
+    # Streams into Postgres itself (no dataset) and refreshes mv_laus_latest when it changed rows
+    laus_ingest.build(args.start_year, args.end_year, full=args.full, offline=args.offline or None)
+
+def _equities(args, inputs):
+    # The refetched daily closes go to the load, which diffs only them
+    df, daily = stocks_ingest.build(full=args.full)
+    return df, ({stocks_ingest.DAILY_DATASET: daily} if daily is not None else {})
+
+def _split(out):
+    return out if isinstance(out, tuple) else (out, {})
+
+def _load(args, inputs):
+    frames = {}
+    for name, out in inputs.items():
+        df, extra = _split(out)
+        frames[STAGES[name]["dataset"]] = df
+        frames.update(extra)
+    load_to_db.main(frames, catalog=False)
+
+def _load_catalog(args, inputs):
+    load_to_db.load_catalog(inputs["ces_catalog"])
+
+def _forecast(args, inputs):
+    # Reads the loaded rollups and writes the forecasts dataset/table itself (after the load)
+    df = forecast.build(refit=args.full)
+    if df is not None:
+        forecast.publish(df, csv=args.csv)
+
+STAGES = {
+    "bls_headline": {"run": _bls_headline, "deps": [], "dataset": bls_ingest.DATASET},
+    "bls_ces":      {"run": _bls_ces,      "deps": [], "dataset": bls_ces_ingest.DATASET},
+    "ces_catalog":  {"run": _ces_catalog,  "deps": [], "dataset": ces_catalog.DATASET},
+    "laus":         {"run": _laus,         "deps": [], "dataset": None},
+    "equities":     {"run": _equities,     "deps": [], "dataset": stocks_ingest.DATASET},
+    "load":         {"run": _load,         "deps": ["bls_headline", "bls_ces", "equities"], "dataset": None},
+    "load_catalog": {"run": _load_catalog, "deps": ["ces_catalog"], "dataset": None},
+    "forecast":     {"run": _forecast,     "deps": ["load"], "dataset": None},
+}
+
+# ---------------- Runner ----------------
+
+def _read_state() -> dict:
+    try:
+        return json.loads(STATE_PATH.read_text())
+    except (OSError, ValueError):
+        return {}
+
+def _write_state(state: dict) -> None:
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    STATE_PATH.write_text(json.dumps(state, indent=2))
+
+def _names(csv: str | None) -> list[str]:
+    names = [n.strip() for n in (csv or "").split(",") if n.strip()]
+    unknown = [n for n in names if n not in STAGES]
+    if unknown:
+        raise SystemExit(f"Unknown stage(s): {', '.join(unknown)} (known: {', '.join(STAGES)})")
+    return names
+
+def _stored_output(name: str):
+    dataset = STAGES[name]["dataset"]
+    return read_dataset(dataset) if dataset else None
+
+def run(args) -> bool:
+    selected = _names(args.only) or list(STAGES)
+    selected = [n for n in selected if n not in _names(args.skip)]
+    state = _read_state() if args.resume else {}
+    if args.resume:
+        selected = [n for n in selected if n not in state.get("done", [])]
+        print(f"Resuming: {', '.join(selected) or 'nothing left to run'}")
+    state = {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "done": list(state.get("done", [])), "failed": None}
+    report = metrics.Run(vars(args), profile=args.profile, trace_memory=args.trace_memory)
+
+    # Dependencies outside this run come from the store (previous run or earlier checkpoint)
+    results = {n: _stored_output(n) for n in STAGES if n not in selected}
+    pending = set(selected)
+    running = {}
+    ok = True
+    with ThreadPoolExecutor(max_workers=1 if report.serial else args.workers) as pool:
+        while pending or running:
+            ready = [n for n in pending if all(d in results for d in STAGES[n]["deps"])]
+            for name in sorted(ready):
+                pending.discard(name)
+                inputs = {d: results[d] for d in STAGES[name]["deps"]}
+                print(f"[{name}] start")
+                running[pool.submit(_run_stage, report, name, args, inputs)] = name
+            if not running:
+                break  # remaining stages depend on a failed one
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    results[name] = fut.result()
+                    state["done"] = sorted(set(state["done"]) | {name})
+                except Exception as e:
+                    print(f"[{name}] FAILED: {e!r}")
+                    state["failed"] = name
+                    ok = False
+                _write_state(state)
+    if pending:
+        print(f"Not run (upstream failure): {', '.join(sorted(pending))}")
+    if ok and not pending:
+        state["done"] = []  # a clean run leaves nothing to resume
+        _write_state(state)
+    _save_report(report, ok and not pending)
+    return ok and not pending
+
+def _run_stage(report, name, args, inputs):
+    with report.stage(name) as s:
+        result = STAGES[name]["run"](args, inputs)
+        out = _split(result)[0]
+        dataset = STAGES[name]["dataset"]
+        if dataset and out is not None:
+            s.add("rows_out", len(out))
+            with metrics.timed("checkpoint_s"):
+                path = write_dataset(dataset, out, csv=args.csv)
+            s.add("store_bytes", sum(f.stat().st_size for f in path.rglob("*.parquet")))
+    print(f"[{name}] done in {s.seconds:.1f}s")
+    return result
+
+def _save_report(report, ok: bool) -> None:
+    # JSON report under data/runs/ always; the history tables when a database is configured
+    rep = report.finish(ok)
+    if not db_configured():
+        return
+    try:
+        engine = get_engine()
+        migrate(engine)
+        metrics.save_history(engine, rep)
+    except Exception as e:
+        print(f"Could not save run history: {e!r}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m etl", description="Jobs vs Wall Street ETL pipeline")
+    sub = ap.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("run", help="run the stage DAG")
+    r.add_argument("--only", help=f"comma-separated stages to run ({', '.join(STAGES)})")
+    r.add_argument("--skip", help="comma-separated stages to skip")
+    r.add_argument("--resume", action="store_true", help="skip stages that completed in the last run")
+    r.add_argument("--full", action="store_true", help="ignore watermarks and rebuild every dataset")
+    r.add_argument("--offline", action="store_true", help="replay BLS responses from the disk cache only")
+    r.add_argument("--csv", action="store_true", default=None, help="also export the legacy CSVs")
+    r.add_argument("--start-year", type=int, default=bls_ingest.DEFAULT_START)
+    r.add_argument("--end-year", type=int, default=None)
+    r.add_argument("--workers", type=int, default=3, help="max stages running at once")
+    r.add_argument("--profile", action="store_true", help="cProfile each stage (runs stages one at a time)")
+    r.add_argument("--trace-memory", action="store_true", help="tracemalloc peaks per stage (runs stages one at a time)")
+    args = ap.parse_args(argv)
+    if args.command == "run":
+        sys.exit(0 if run(args) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+from sqlalchemy import text
+from schema import MIGRATION_LOCK
+
+# Month-keyed materialized views the dashboard reads instead of aggregating raw tables.
+# Each needs a unique index so it can be refreshed CONCURRENTLY (readers never block), and
+# lists the base tables it reads so a load refreshes only the views over what it loaded.
+ROLLUPS = {
+    "mv_unemployment": {
+        "sql": """
+            select ym, avg(unemployment_rate) as unemployment_rate
+            from unemployment_headline
+            group by 1
+        """,
+        "unique": ["ym"],
+        "indexes": [],
+        "tables": ["unemployment_headline"],
+    },
+    "mv_equities_monthly": {
+        "sql": """
+            select ym,
+                   ticker,
+                   max(adj_close) as adj_close,          -- end-of-month
+                   avg(monthly_return) as monthly_return
+            from equities_monthly
+            group by 1, 2
+        """,
+        "unique": ["ticker", "ym"],
+        "indexes": [["ym"]],
+        "tables": ["equities_monthly"],
+    },
+    "mv_employment_sector": {
+        "sql": """
+            select ym, sector_code, sector_name, employment_thousands,
+                   employment_thousands
+                     / nullif(lag(employment_thousands) over (partition by sector_code order by ym), 0)
+                     - 1 as emp_pct_change
+            from (
+                select ym,
+                       sector_code,
+                       max(sector_name) as sector_name,
+                       avg(employment_thousands) as employment_thousands
+                from employment_sector
+                group by 1, 2
+            ) m
+        """,
+        "unique": ["sector_code", "ym"],
+        "indexes": [["sector_name", "ym"]],
+        "tables": ["employment_sector"],
+    },
+    # Detailed CES industries (seasonally adjusted employment), shaped like mv_employment_sector
+    "mv_ces_industry": {
+        "sql": """
+            select ym, sector_code, sector_name, employment_thousands,
+                   employment_thousands
+                     / nullif(lag(employment_thousands) over (partition by sector_code order by ym), 0)
+                     - 1 as emp_pct_change
+            from (
+                select o.ym,
+                       o.series_id as sector_code,
+                       max(s.industry_name) as sector_name,
+                       avg(o.value) as employment_thousands
+                from ces_observations o
+                join ces_series s using (series_id)
+                where s.data_type_code = '01' and s.seasonal = 'S'
+                group by 1, 2
+            ) m
+        """,
+        "unique": ["sector_code", "ym"],
+        "indexes": [["sector_name", "ym"]],
+        "tables": ["ces_observations", "ces_series"],
+    },
+    # Latest month of every LAUS area (etl/laus_ingest.py): unemployment rate, labor force and
+    # the change on a year earlier. Prefers the seasonally adjusted series where both exist.
+    # The date predicate lets the planner prune laus_observations down to the last two years.
+    "mv_laus_latest": {
+        "sql": """
+            with latest as (
+                select max(period_date) as d from laus_observations where measure_code = '03'
+            ),
+            recent as (
+                select distinct on (o.area_code, o.measure_code, o.period_date)
+                       o.area_code, o.measure_code, o.ym, o.value
+                from laus_observations o, latest
+                where o.measure_code in ('03', '06')
+                  and o.period_date >= (latest.d - interval '12 months')::date
+                order by o.area_code, o.measure_code, o.period_date, o.seasonal
+            )
+            select a.area_code, a.area_type, a.area_text, a.state_fips, a.state_abbr,
+                   r.ym,
+                   r.value as unemployment_rate,
+                   r.value - y.value as rate_change_yoy,
+                   lf.value as labor_force
+            from recent r
+            join latest on r.ym = latest.d
+            join laus_areas a on a.area_code = r.area_code
+            left join recent y on y.area_code = r.area_code and y.measure_code = '03'
+                              and y.ym = (latest.d - interval '12 months')::date
+            left join recent lf on lf.area_code = r.area_code and lf.measure_code = '06' and lf.ym = r.ym
+            where r.measure_code = '03'
+        """,
+        "unique": ["area_code"],
+        "indexes": [["area_type", "state_fips"]],
+        "tables": ["laus_observations", "laus_areas"],
+    },
+}
+
+def _exists(conn, name: str) -> bool:
+    sql = "select 1 from pg_matviews where matviewname = :n and schemaname = current_schema()"
+    return conn.execute(text(sql), {"n": name}).first() is not None
+
+def rollups_over(tables) -> list[str]:
+    return [name for name, spec in ROLLUPS.items() if set(spec["tables"]) & set(tables)]
+
+def refresh_rollups(engine, changed: bool = True, names: list[str] | None = None) -> None:
+    # Create missing views (populated), refresh existing ones only when base data changed.
+    # names limits the run to some views (e.g. the LAUS ingest refreshing its own). Stages
+    # run concurrently, so the migration lock makes the exists check and create one step.
+    with engine.begin() as conn:
+        conn.execute(text("select pg_advisory_xact_lock(:k)"), {"k": MIGRATION_LOCK})
+        for name, spec in ROLLUPS.items():
+            if names is not None and name not in names:
+                continue
+            if not _exists(conn, name):
+                conn.execute(text(f"create materialized view {name} as {spec['sql']} with data"))
+                cols = ", ".join(spec["unique"])
+                conn.execute(text(f"create unique index {name}_uq on {name} ({cols})"))
+                for idx in spec["indexes"]:
+                    conn.execute(text(f"create index {name}_{'_'.join(idx)}_idx on {name} ({', '.join(idx)})"))
+                print(f"{name}: created")
+            elif changed:
+                conn.execute(text(f"refresh materialized view concurrently {name}"))
+                print(f"{name}: refreshed")
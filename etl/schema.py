@@ -0,0 +1,193 @@
+from sqlalchemy import text
+
+# Versioned schema migrations, applied in order by the loader. Never edit a shipped
+# migration; append a new one. Statements must be safe on databases that predate this
+# module (tables created by hand), hence the IF NOT EXISTS guards.
+MIGRATIONS = [
+    (1, "base tables with primary keys", [
+        """create table if not exists unemployment_headline (
+               period_date       date primary key,
+               unemployment_rate double precision
+           )""",
+        """create table if not exists employment_sector (
+               period_date          date not null,
+               sector_code          text not null,
+               sector_name          text,
+               employment_thousands double precision,
+               primary key (period_date, sector_code)
+           )""",
+        """create table if not exists equities_monthly (
+               period_date    date not null,
+               ticker         text not null,
+               adj_close      double precision,
+               monthly_return double precision,
+               primary key (period_date, ticker)
+           )""",
+    ]),
+    # Index-friendly month key: filter on ym instead of date_trunc(period_date).
+    # date -> timestamp (no tz) keeps the expression immutable, as generated columns require.
+    (2, "stored ym month keys", [
+        f"""alter table {t} add column if not exists ym date
+                generated always as (date_trunc('month', period_date::timestamp)::date) stored"""
+        for t in ("unemployment_headline", "employment_sector", "equities_monthly")
+    ]),
+    (3, "month-key indexes", [
+        "create index if not exists unemployment_headline_ym_idx on unemployment_headline (ym)",
+        "create index if not exists employment_sector_name_ym_idx on employment_sector (sector_name, ym)",
+        "create index if not exists equities_monthly_ticker_ym_idx on equities_monthly (ticker, ym)",
+        "create index if not exists equities_monthly_ym_brin on equities_monthly using brin (ym)",
+    ]),
+    (4, "data version table", [
+        """create table if not exists etl_data_version (
+               table_name text primary key,
+               version    bigint not null,
+               loaded_at  timestamptz not null default now()
+           )""",
+    ]),
+    # Rollups are rebuilt by etl/rollups.py on the next load, now aggregating on ym
+    (5, "rebuild rollups on ym", [
+        "drop materialized view if exists mv_monthly_fact",
+        "drop materialized view if exists mv_employment_sector",
+        "drop materialized view if exists mv_equities_monthly",
+        "drop materialized view if exists mv_unemployment",
+    ]),
+    # Written by etl/metrics.py after every `python -m etl run`
+    (6, "run history", [
+        """create table if not exists etl_run_history (
+               run_id     text primary key,
+               started_at timestamptz not null,
+               seconds    double precision,
+               ok         boolean not null,
+               report     jsonb not null
+           )""",
+        """create table if not exists etl_stage_history (
+               run_id        text not null references etl_run_history on delete cascade,
+               stage         text not null,
+               status        text not null,
+               seconds       double precision,
+               rows_out      bigint,
+               http_requests bigint,
+               http_bytes    bigint,
+               db_rows       bigint,
+               metrics       jsonb not null,
+               primary key (run_id, stage)
+           )""",
+        "create index if not exists etl_stage_history_stage_idx on etl_stage_history (stage, run_id)",
+    ]),
+    # Detailed CES catalog (etl/ces_catalog.py): series definitions with the industry tree,
+    # and their observations keyed by series code
+    (7, "ces catalog", [
+        """create table if not exists ces_series (
+               series_id        text primary key,
+               supersector_code text,
+               supersector_name text,
+               industry_code    text,
+               naics_code       text,
+               industry_name    text,
+               display_level    smallint,
+               parent_code      text,
+               path             text,
+               data_type_code   text,
+               data_type_text   text,
+               seasonal         text,
+               series_title     text,
+               begin_year       int,
+               end_year         int
+           )""",
+        "create index if not exists ces_series_industry_idx on ces_series (industry_code, data_type_code)",
+        "create index if not exists ces_series_parent_idx on ces_series (parent_code)",
+        """create table if not exists ces_observations (
+               series_id   text not null,
+               period_date date not null,
+               value       double precision,
+               preliminary boolean,
+               ym          date generated always as (date_trunc('month', period_date::timestamp)::date) stored,
+               primary key (series_id, period_date)
+           )""",
+        "create index if not exists ces_observations_ym_idx on ces_observations (ym)",
+    ]),
+    # State/metro/county LAUS (etl/laus_ingest.py). Observations are range-partitioned by
+    # period year; the ingest creates laus_observations_y<YYYY> partitions as data arrives.
+    (8, "laus tables", [
+        """create table if not exists laus_areas (
+               area_code  text primary key,
+               area_type  text,
+               area_text  text,
+               state_fips text,
+               state_abbr text
+           )""",
+        """create table if not exists laus_observations (
+               series_id    text not null,
+               area_code    text not null,
+               measure_code text not null,
+               seasonal     text not null,
+               period_date  date not null,
+               value        double precision,
+               preliminary  boolean,
+               ym           date generated always as (date_trunc('month', period_date::timestamp)::date) stored,
+               primary key (series_id, period_date)
+           ) partition by range (period_date)""",
+        "create index if not exists laus_observations_area_idx on laus_observations (area_code, measure_code, ym)",
+    ]),
+    # Optional daily closes (stocks_ingest --daily), partitioned by year like laus_observations;
+    # equities_monthly stays the month-end table the rollups read
+    (9, "equities_daily", [
+        """create table if not exists equities_daily (
+               period_date date not null,
+               ticker      text not null,
+               adj_close   double precision,
+               primary key (period_date, ticker)
+           ) partition by range (period_date)""",
+        "create index if not exists equities_daily_ticker_idx on equities_daily (ticker, period_date)",
+    ]),
+    # Written by etl/forecast.py after each load; the dashboard reads it as is
+    (10, "forecasts", [
+        """create table if not exists forecasts (
+               series_key     text not null,
+               series_name    text,
+               period_date    date not null,
+               value          double precision,
+               lo80           double precision,
+               hi80           double precision,
+               lo95           double precision,
+               hi95           double precision,
+               model          text,
+               last_actual    date,
+               fitted_through date,
+               ym             date generated always as (date_trunc('month', period_date::timestamp)::date) stored,
+               primary key (series_key, period_date)
+           )""",
+    ]),
+    # mv_monthly_fact had no reader left once the dashboard sliced the rollups in memory
+    (11, "drop mv_monthly_fact", [
+        "drop materialized view if exists mv_monthly_fact",
+    ]),
+]
+
+MIGRATION_LOCK = 720_514  # pg advisory lock id: one migrator (or rollup DDL) at a time
+
+def migrate(engine) -> int:
+    # Apply pending migrations, each in its own transaction; returns the schema version.
+    # Stages migrate concurrently: even "create table if not exists" can race on first run.
+    with engine.begin() as conn:
+        conn.execute(text("select pg_advisory_xact_lock(:k)"), {"k": MIGRATION_LOCK})
+        conn.execute(text("""
+            create table if not exists schema_migrations (
+                version     int primary key,
+                description text not null,
+                applied_at  timestamptz not null default now()
+            )
+        """))
+    current = 0
+    for version, description, statements in MIGRATIONS:
+        with engine.begin() as conn:
+            conn.execute(text("select pg_advisory_xact_lock(:k)"), {"k": MIGRATION_LOCK})
+            done = conn.execute(text("select 1 from schema_migrations where version = :v"), {"v": version}).first()
+            if not done:
+                for stmt in statements:
+                    conn.execute(text(stmt))
+                conn.execute(text("insert into schema_migrations (version, description) values (:v, :d)"),
+                             {"v": version, "d": description})
+                print(f"schema: applied {version} ({description})")
+        current = version
+    return current
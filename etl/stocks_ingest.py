@@ -1,49 +1,319 @@
+import os
+import time
+import json
+import hashlib
+import argparse
 from datetime import date
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 import yfinance as yf
+from common import read_existing, merge_incremental
+from store import DATA_DIR, read_dataset, write_dataset
+import metrics
 
-# S&P 500 + sector ETFs (add/remove as needed)
+DATASET = "equities"
+DAILY_DATASET = "equities_daily"
+DAILY = os.getenv("EQUITIES_DAILY", "0") == "1"  # also keep every daily close (equities_daily)
+FULL_START = "1999-01-01"
+RESTATE_TOL = 1e-4  # relative adj_close drift in the overlap month that forces a full refresh
+
+# Universe: one ticker per row of a CSV (ticker[,name,...]; '#' starts a comment)
+UNIVERSE_PATH = Path(os.getenv("EQUITIES_UNIVERSE", Path(__file__).with_name("universe.csv")))
+# Used when the universe file is missing: S&P 500 + sector ETFs
 TICKERS = [
     "^GSPC", "XLY", "XLP", "XLE", "XLF",
     "XLV", "XLI", "XLB", "XLK", "XLU", "XLRE", "XLC"
 ]
 
-def main():
-    print(f"Fetching {len(TICKERS)} tickers...")
-    data = yf.download(
-        TICKERS,
-        start="1999-01-01",
-        end=str(date.today()),
-        auto_adjust=True,
-        progress=False,
-    )
+# Downloads go out in batches of tickers on a small pool; each batch is retried with backoff,
+# and tickers missing from their batch get one more round before they count as failed
+SOURCE = os.getenv("EQUITIES_SOURCE", "yfinance")  # or a directory of <ticker>.csv (Date, Close)
+BATCH_SIZE = int(os.getenv("EQUITIES_BATCH_SIZE", "50"))
+WORKERS = int(os.getenv("EQUITIES_WORKERS", "4"))
+RETRIES = int(os.getenv("EQUITIES_RETRIES", "3"))
+BACKOFF = float(os.getenv("EQUITIES_BACKOFF", "2.0"))  # seconds, doubled per retry
+BATCHES_DIR = DATA_DIR / ".equities_batches"  # today's finished batches, reused by a rerun
+
+def read_universe(path: Path = UNIVERSE_PATH) -> list[str]:
+    if not path.exists():
+        print(f"{path} not found; using the built-in tickers")
+        return list(TICKERS)
+    df = pd.read_csv(path, comment="#", dtype=str, skipinitialspace=True)
+    tickers = df["ticker"].str.strip().dropna()
+    return list(dict.fromkeys(t for t in tickers if t))
+
+# ---------------- Price sources ----------------
+# A source takes (tickers, start) and returns a yfinance-shaped frame: ("Close", ticker) columns
+# indexed by trading day. Tickers it has no prices for are simply absent (or all NaN).
+
+def yfinance_source(tickers, start) -> pd.DataFrame:
+    return yf.download(list(tickers), start=str(start), end=str(date.today()), auto_adjust=True,
+                       progress=False, group_by="column")
+
+def csv_source(directory):
+    # Local stand-in for yfinance: <directory>/<ticker>.csv with Date and Close columns
+    directory = Path(directory)
+
+    def fetch(tickers, start) -> pd.DataFrame:
+        closes = {}
+        for t in tickers:
+            path = directory / f"{t}.csv"
+            if path.exists():
+                df = pd.read_csv(path, parse_dates=["Date"], index_col="Date")
+                closes[t] = df.loc[df.index >= pd.Timestamp(start), "Close"]
+        px = pd.DataFrame(closes)
+        px.columns = pd.MultiIndex.from_product([["Close"], px.columns])
+        return px
+    return fetch
+
+def price_source(spec: str = SOURCE):
+    return yfinance_source if spec == "yfinance" else csv_source(spec)
+
+# ---------------- Download ----------------
+
+def _batch_key(tickers, start) -> str:
+    return hashlib.sha256(json.dumps([sorted(tickers), str(start)]).encode()).hexdigest()[:16]
+
+def _download_batch(source, tickers, start) -> pd.DataFrame:
+    # One batch with retries; the daily rows of whichever tickers came back. Finished batches
+    # are kept for the day, so a rerun after a crash only downloads what is left.
+    path = BATCHES_DIR / f"{date.today()}-{_batch_key(tickers, start)}.parquet"
+    if path.exists():
+        return pd.read_parquet(path)
+    for attempt in range(RETRIES + 1):
+        try:
+            with metrics.timed("download_s"):
+                data = source(tickers, start)
+            break
+        except Exception as e:
+            if attempt >= RETRIES:
+                raise
+            wait = BACKOFF * 2 ** attempt
+            print(f"Equities batch of {len(tickers)} ({tickers[0]}..): {e}; retrying in {wait:.1f}s")
+            metrics.count("download_retries")
+            time.sleep(wait)
+    metrics.count("download_batches")
+    metrics.count("download_rows", len(data))
+    with metrics.timed("transform_s"):
+        daily = to_daily(data, tickers) if not data.empty else pd.DataFrame(columns=["period_date", "ticker", "adj_close"])
+    BATCHES_DIR.mkdir(parents=True, exist_ok=True)
+    daily.to_parquet(path, index=False)
+    return daily
+
+def _download_round(source, tickers, start, batch_size, workers) -> tuple[list, list]:
+    batches = [tickers[i:i + batch_size] for i in range(0, len(tickers), batch_size)]
+    frames, missing = [], []
+    fetch = metrics.bind(_download_batch)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as pool:
+        futures = {pool.submit(fetch, source, b, start): b for b in batches}
+        for fut in as_completed(futures):
+            batch = futures[fut]
+            try:
+                daily = fut.result()
+            except Exception as e:
+                print(f"Equities batch of {len(batch)} ({batch[0]}..) failed after {RETRIES} retries: {e}")
+                missing += batch
+                continue
+            got = set(map(str, daily["ticker"].unique()))
+            missing += [t for t in batch if t not in got]
+            frames.append(daily)
+    return frames, missing
 
+def download_daily(tickers, start, source=None, batch_size=BATCH_SIZE, workers=WORKERS) -> tuple[pd.DataFrame, list]:
+    # Daily closes of every ticker that could be fetched, plus the tickers that could not.
+    # One bad ticker only costs its own rows: it is retried in a smaller batch, then reported.
+    source = source or price_source()
+    tickers = list(tickers)
+    metrics.count("download_tickers", len(tickers))
+    for old in BATCHES_DIR.glob("*.parquet"):
+        if not old.name.startswith(str(date.today())):
+            old.unlink()
+    frames, missing = _download_round(source, tickers, start, batch_size, workers)
+    if missing:
+        print(f"Equities: retrying {len(missing)} missing tickers in smaller batches")
+        more, missing = _download_round(source, missing, start, max(1, batch_size // 10), workers)
+        frames += more
+    if missing:
+        metrics.count("download_failed", len(missing))
+        metrics.note("failed_tickers", sorted(missing))
+        print(f"Equities: no prices for {len(missing)} tickers: {', '.join(sorted(missing))}")
+    return concat_daily(frames), missing
+
+def concat_daily(frames) -> pd.DataFrame:
+    # Daily frames for disjoint tickers, each grouped by ticker in date order (and so is the result)
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=["period_date", "ticker", "adj_close"])
+    tickers = union_categoricals([f["ticker"].astype("category") for f in frames], sort_categories=True)
+    daily = pd.concat([f.drop(columns="ticker") for f in frames], ignore_index=True)
+    return daily.assign(ticker=tickers)[["period_date", "ticker", "adj_close"]]
+
+def to_daily(data: pd.DataFrame, tickers) -> pd.DataFrame:
     # yfinance returns MultiIndex columns for multiple tickers
     if isinstance(data.columns, pd.MultiIndex):
-        px = data["Close"].copy()
+        px = data["Close"]
     else:
         # Single ticker fallback; rename to a consistent column
-        px = data.rename(columns={"Close": TICKERS[0]})
+        px = data[["Close"]].rename(columns={"Close": tickers[0]})
 
-    # Month-end buckets, last price in each month
-    monthly = px.resample("ME").last()
+    # Long format, one row per ticker and trading day, grouped by ticker in date order.
+    # Built from the ticker-major ravel of the price matrix instead of stack + sort.
+    px = px.sort_index()
+    values = px.to_numpy(dtype=float).T.ravel()
+    keep = ~np.isnan(values)  # pre-inception days
+    days, n = px.index.to_numpy(), px.shape[1]
+    return pd.DataFrame({
+        "period_date": np.tile(days, n)[keep],
+        "ticker": pd.Categorical.from_codes(np.repeat(np.arange(n), len(days))[keep],
+                                            categories=px.columns.astype(str)),
+        "adj_close": values[keep],
+    })
 
-    # Long format
-    df = monthly.stack().reset_index()
-    df.columns = ["period_date", "ticker", "adj_close"]
+def to_monthly(daily: pd.DataFrame) -> pd.DataFrame:
+    # Last close of each (ticker, month), stamped at month-end. daily must be grouped by
+    # ticker in date order (as to_daily returns it): a row is a month's last when the next
+    # row starts another month or ticker.
+    month = daily["period_date"].to_numpy().astype("datetime64[M]")
+    tick = daily["ticker"]
+    tick = tick.cat.codes.to_numpy() if isinstance(tick.dtype, pd.CategoricalDtype) else pd.factorize(tick)[0]
+    last = np.ones(len(daily), dtype=bool)
+    last[:-1] = (month[1:] != month[:-1]) | (tick[1:] != tick[:-1])
+    month_end = (month[last] + 1).astype("datetime64[D]") - np.timedelta64(1, "D")
+    return pd.DataFrame({
+        "period_date": month_end.astype("datetime64[ns]"),
+        "ticker": daily["ticker"][last].reset_index(drop=True),
+        "adj_close": daily["adj_close"].to_numpy()[last],
+    })
 
+def add_returns(df: pd.DataFrame) -> pd.DataFrame:
     # Compute monthly returns per ticker
+    df = df.sort_values(["ticker", "period_date"]).copy()
     df["monthly_return"] = df.groupby("ticker")["adj_close"].pct_change()
+    return df
+
+def incremental(existing: pd.DataFrame, tickers, source=None) -> tuple[pd.DataFrame, list, pd.DataFrame, list]:
+    # Refetch from the month before each ticker's last stored month-end: that month is the
+    # overlap used to detect restatements, and supplies the prior close for the boundary return.
+    # Also returns the fetched daily closes of the tickers that were not restated, and the
+    # tickers whose download failed (their stored rows are kept as they are).
+    last = existing.groupby("ticker", observed=True)["period_date"].max()
+    known = [t for t in tickers if t in last.index]
+    refresh = [t for t in tickers if t not in last.index]
+    if not known:
+        return pd.DataFrame(), refresh, pd.DataFrame(), []
+
+    # One download per staleness group, so a lagging ticker does not drag the rest back
+    groups = {}
+    for t in known:
+        groups.setdefault((last[t] - pd.offsets.MonthBegin(2)).date(), []).append(t)
+    frames, failed = [], []
+    for start, group in sorted(groups.items()):
+        print(f"Incremental: fetching {len(group)} tickers from {start}")
+        d, f = download_daily(group, start, source)
+        frames.append(d)
+        failed += f
+    daily = concat_daily(frames)
+    fresh = to_monthly(daily)
+    stored = existing.set_index(["ticker", "period_date"])["adj_close"]
+    by_ticker = {str(t): f for t, f in fresh.groupby("ticker", observed=True, sort=False)}
+
+    parts = []
+    for t in known:
+        if t in failed:
+            continue
+        boundary = last[t]                       # possibly a partial month; recomputed
+        overlap = boundary - pd.offsets.MonthEnd(1)
+        f = by_ticker.get(t, fresh.iloc[:0])
+        f = f[f["period_date"] >= overlap].sort_values("period_date")
+        new_prev = f.loc[f["period_date"] == overlap, "adj_close"]
+        old_prev = stored.get((t, overlap))
+        if new_prev.empty or old_prev is None or abs(new_prev.iloc[0] / old_prev - 1) > RESTATE_TOL:
+            print(f"{t}: adjusted history restated (or overlap missing); full refresh")
+            refresh.append(t)
+            continue
+        f = f.assign(monthly_return=f["adj_close"].pct_change())
+        parts.append(f[f["period_date"] >= boundary])
+    daily = daily[~daily["ticker"].isin(refresh)]
+    return (pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()), refresh, daily, failed
+
+def build(full=False, daily=DAILY, tickers=None, source=None) -> tuple[pd.DataFrame, pd.DataFrame | None]:
+    # Returns the monthly dataset; with daily=True also writes equities_daily, from the same
+    # downloads (monthly rows are always derived from the daily closes), and returns the daily
+    # closes this run fetched (None without daily) so the load only diffs those. Tickers that
+    # fail to download keep whatever is stored for them; the run only fails if every ticker did.
+    tickers = list(tickers or read_universe())
+    existing = None if full else read_existing(DATASET, "equities_monthly")
+    stored_daily = read_dataset(DAILY_DATASET) if daily and existing is not None else None
+    failed = []
+    if existing is not None and not existing.empty:
+        existing = existing[["period_date", "ticker", "adj_close", "monthly_return"]]
+        # Tickers without stored daily history need their full history once
+        no_daily = []
+        if daily:
+            have = set(map(str, stored_daily["ticker"].unique())) if stored_daily is not None else set()
+            no_daily = [t for t in tickers if t not in have]
+        new_rows, refresh, fresh_daily, failed = incremental(existing, [t for t in tickers if t not in no_daily], source)
+        refresh += no_daily
+    else:
+        existing, new_rows, refresh, fresh_daily = None, pd.DataFrame(), list(tickers), pd.DataFrame()
+    daily_frames = [fresh_daily]
+
+    frames = []
+    if refresh:
+        print(f"Fetching {len(refresh)} tickers (full history)...")
+        full_daily, refresh_failed = download_daily(refresh, FULL_START, source)
+        failed += refresh_failed
+        refresh = [t for t in refresh if t not in refresh_failed]
+        daily_frames.append(full_daily)
+        full = add_returns(to_monthly(full_daily))
+        # Drop rows without prices (e.g., pre-inception)
+        before = len(full)
+        full = full.dropna(subset=["adj_close"])
+        dropped = before - len(full)
+        if dropped:
+            print(f"Dropped {dropped} rows with null adj_close (pre-inception)")
+        frames.append(full)
+    if len(failed) == len(tickers):
+        raise RuntimeError(f"Equities: no prices downloaded for any of {len(tickers)} tickers")
+    if existing is not None:
+        frames.insert(0, existing[~existing["ticker"].isin(refresh)])
+    if not new_rows.empty:
+        frames.append(new_rows)
+
+    df = merge_incremental(frames[0], pd.concat(frames[1:]), ["period_date", "ticker"]) if len(frames) > 1 else frames[0]
+    df = df.dropna(subset=["adj_close"]).sort_values(["period_date", "ticker"]).reset_index(drop=True)
+    print(f"Built {DATASET} ({len(new_rows)} incremental rows, {len(refresh)} full refreshes, "
+          f"{len(failed)} tickers failed)")
+    return df, write_daily(stored_daily, daily_frames, refresh) if daily else None
+
+def write_daily(stored, fresh_frames, refresh) -> pd.DataFrame:
+    # Writes the merged dataset; returns just the fetched closes
+    fresh = pd.concat([f for f in fresh_frames if not f.empty] or [pd.DataFrame(columns=["period_date", "ticker", "adj_close"])])
+    df = fresh
+    if stored is not None:
+        stored = stored[~stored["ticker"].isin(refresh)]
+        df = merge_incremental(stored, fresh, ["period_date", "ticker"])
+    df = df.sort_values(["period_date", "ticker"]).reset_index(drop=True)
+    path = write_dataset(DAILY_DATASET, df)
+    print(f"Saved {path} ({len(df)} daily closes, {len(fresh)} fetched)")
+    return fresh.reset_index(drop=True)
 
-    # Drop rows without prices (e.g., pre-inception)
-    before = len(df)
-    df = df.dropna(subset=["adj_close"])
-    dropped = before - len(df)
-    if dropped:
-        print(f"Dropped {dropped} rows with null adj_close (pre-inception)")
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Fetch month-end equities/ETF prices")
+    ap.add_argument("--full", action="store_true", help="ignore stored months and refetch all history")
+    ap.add_argument("--csv", action="store_true", default=None, help="also export the legacy CSV")
+    ap.add_argument("--daily", action="store_true", default=DAILY, help="also store daily closes (equities_daily)")
+    ap.add_argument("--universe", type=Path, default=UNIVERSE_PATH, help="CSV with a ticker column")
+    ap.add_argument("--source", default=SOURCE, help="'yfinance' or a directory of <ticker>.csv files")
+    args = ap.parse_args(argv)
 
-    df.to_csv("equities_monthly.csv", index=False)
-    print("Saved equities_monthly.csv")
+    df, _ = build(full=args.full, daily=args.daily, tickers=read_universe(args.universe),
+                  source=price_source(args.source))
+    path = write_dataset(DATASET, df, csv=args.csv)
+    print(f"Saved {path}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,150 @@
+import os
+import shutil
+import hashlib
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Typed intermediate store shared by the ETL stages: one partitioned Parquet dataset per
+# stage output (data/<name>/year=YYYY/...), with the legacy CSVs as an optional export.
+REPO_ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = Path(os.getenv("ETL_DATA_DIR", REPO_ROOT / "data"))
+EXPORT_CSV = os.getenv("ETL_EXPORT_CSV", "0") == "1"
+HASH_FILE = "_content_hash"  # beside the partitions; readers skip "_" files
+
+_category = pa.dictionary(pa.int32(), pa.string())
+
+DATASETS = {
+    "unemployment": {
+        "csv": "bls_unemployment.csv",
+        "schema": pa.schema([
+            ("period_date", pa.date32()),
+            ("unemployment_rate", pa.float64()),
+        ]),
+    },
+    "ces": {
+        "csv": "bls_ces_supersectors.csv",
+        "schema": pa.schema([
+            ("period_date", pa.date32()),
+            ("sector_code", _category),
+            ("sector_name", _category),
+            ("employment_thousands", pa.float64()),
+        ]),
+    },
+    "equities": {
+        "csv": "equities_monthly.csv",
+        "schema": pa.schema([
+            ("period_date", pa.date32()),
+            ("ticker", _category),
+            ("adj_close", pa.float64()),
+            ("monthly_return", pa.float64()),
+        ]),
+    },
+    # Daily closes (stocks_ingest --daily / EQUITIES_DAILY=1); equities is derived from these
+    "equities_daily": {
+        "csv": "equities_daily.csv",
+        "schema": pa.schema([
+            ("period_date", pa.date32()),
+            ("ticker", _category),
+            ("adj_close", pa.float64()),
+        ]),
+    },
+    # Detailed CES catalog (etl/ces_catalog.py): every value of every catalog series
+    "ces_catalog": {
+        "csv": "bls_ces_catalog.csv",
+        "schema": pa.schema([
+            ("period_date", pa.date32()),
+            ("series_id", _category),
+            ("value", pa.float64()),
+            ("preliminary", pa.bool_()),
+        ]),
+    },
+    # Forecasts (etl/forecast.py): HORIZON months per series after its last actual month
+    "forecasts": {
+        "csv": "forecasts.csv",
+        "schema": pa.schema([
+            ("period_date", pa.date32()),
+            ("series_key", _category),
+            ("series_name", _category),
+            ("value", pa.float64()),
+            ("lo80", pa.float64()),
+            ("hi80", pa.float64()),
+            ("lo95", pa.float64()),
+            ("hi95", pa.float64()),
+            ("model", _category),
+            ("last_actual", pa.date32()),
+            ("fitted_through", pa.date32()),
+        ]),
+    },
+}
+
+def dataset_path(name: str) -> Path:
+    return DATA_DIR / name
+
+def _columns(name: str, df: pd.DataFrame) -> pd.DataFrame:
+    df = df[DATASETS[name]["schema"].names].copy()
+    # from_pandas casts to date32 (no .dt.date objects); one unit so equal dates hash equal
+    df["period_date"] = pd.to_datetime(df["period_date"]).astype("datetime64[ns]")
+    return df
+
+def _to_table(name: str, df: pd.DataFrame) -> pa.Table:
+    table = pa.Table.from_pandas(_columns(name, df), schema=DATASETS[name]["schema"], preserve_index=False)
+    years = pc.year(table["period_date"]).cast(pa.int16())
+    return table.append_column("year", years)
+
+def content_hash(name: str, df: pd.DataFrame) -> str:
+    # Rows in order, by value (a categorical hashes like its strings)
+    df = _columns(name, df)
+    h = hashlib.sha256(",".join(df.columns).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()[:16]
+
+def stored_hash(name: str) -> str | None:
+    try:
+        return (dataset_path(name) / HASH_FILE).read_text()
+    except OSError:
+        return None
+
+def write_dataset(name: str, df: pd.DataFrame, csv: bool | None = None) -> Path:
+    # Replace the whole dataset atomically-ish: write beside it, then swap directories.
+    # The same rows as stored are not rewritten, so the files (and readers' caches of them,
+    # e.g. the DuckDB warehouse) only change with the data.
+    path = dataset_path(name)
+    digest = content_hash(name, df)
+    if stored_hash(name) != digest:
+        tmp = path.with_name(f".{name}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        pq.write_to_dataset(_to_table(name, df), tmp, partition_cols=["year"],
+                            basename_template="part-{i}.parquet")
+        (tmp / HASH_FILE).write_text(digest)
+        shutil.rmtree(path, ignore_errors=True)
+        tmp.rename(path)
+    if EXPORT_CSV if csv is None else csv:
+        df.to_csv(DATASETS[name]["csv"], index=False, date_format="%Y-%m-%d")
+    return path
+
+def read_dataset(name: str, columns: list[str] | None = None, filters=None) -> pd.DataFrame | None:
+    # Column projection and predicate pushdown (pyarrow filters, e.g. [("year", ">=", 2020)])
+    # on memory-mapped Parquet; falls back to the CSV export when no Parquet exists yet.
+    schema = DATASETS[name]["schema"]
+    path = dataset_path(name)
+    if path.exists():
+        table = pq.read_table(path, columns=columns or schema.names, filters=filters,
+                              memory_map=True, partitioning="hive")
+    elif os.path.exists(DATASETS[name]["csv"]):
+        df = pd.read_csv(DATASETS[name]["csv"], usecols=columns, float_precision="round_trip")
+        if "period_date" in df:
+            df["period_date"] = pd.to_datetime(df["period_date"]).dt.date
+        sub = pa.schema([schema.field(c) for c in df.columns])
+        table = pa.Table.from_pandas(df, schema=sub, preserve_index=False)
+        if filters:
+            table = table.append_column("year", pc.year(table["period_date"]).cast(pa.int16()))
+            table = table.filter(pq.filters_to_expression(filters)).drop_columns(["year"])
+    else:
+        return None
+    df = table.to_pandas(date_as_object=False)
+    if "period_date" in df:
+        df["period_date"] = df["period_date"].astype("datetime64[ns]")
+    return df
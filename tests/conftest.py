@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The ETL modules import each other flat (see etl/__init__.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
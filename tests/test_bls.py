@@ -0,0 +1,115 @@
+# Offline tests for BLS request planning, parsing, caching and incremental merges
+import pandas as pd
+import pytest
+import common
+import store
+import bls_ingest
+import ces_catalog
+from ces_catalog import plan_requests
+
+def obs(year, period, value, footnotes=None):
+    return {"year": str(year), "period": period, "value": str(value), "footnotes": footnotes or [{}]}
+
+# ---------------- Request limits ----------------
+
+@pytest.mark.parametrize("key, limits, n_chunks", [("k", (50, 20), 2 * 2), (None, (25, 10), 3 * 3)])
+def test_chunks_respect_limits(monkeypatch, key, limits, n_chunks):
+    monkeypatch.setattr(common, "BLS_API_KEY", key)
+    assert common.bls_limits() == limits
+    max_series, max_years = limits
+    ids = [f"S{i:03d}" for i in range(60)]
+    chunks = common.bls_chunks(ids + ids[:5], 2000, 2025, max_series, max_years)  # duplicates collapse
+    assert len(chunks) == n_chunks
+    covered = []
+    for chunk_ids, sy, ey in chunks:
+        assert len(chunk_ids) <= max_series and ey - sy + 1 <= max_years
+        covered += [(i, y) for i in chunk_ids for y in range(sy, ey + 1)]
+    assert sorted(covered) == sorted((i, y) for i in ids for y in range(2000, 2026))
+
+def test_plan_requests_packs_blocks():
+    # 30 series need everything, 30 only the revision window: 1 request for the old block,
+    # 2 for the recent one, and the second of those asks only for the years its series need
+    need = pd.DataFrame({
+        "series_id": [f"A{i:02d}" for i in range(30)] + [f"B{i:02d}" for i in range(30)],
+        "start": [2000] * 30 + [2024] * 30,
+        "end": [2025] * 60,
+    })
+    reqs = plan_requests(need, max_series=50, max_years=20, anchor=2000)
+    assert [(len(ids), sy, ey) for ids, sy, ey in reqs] == [(30, 2000, 2019), (50, 2020, 2025), (10, 2024, 2025)]
+    assert len(plan_requests(need.assign(start=2000), 25, 10, 2000)) == 3 * 3
+
+# ---------------- Parsing ----------------
+
+SERIES = [{"seriesID": "LNS14000000", "data": [
+    obs(2024, "M02", "3.9", [{"code": "P", "text": "preliminary"}]),
+    obs(2024, "M01", "3.7"),
+    obs(2023, "M13", "3.6"),
+    obs(2023, "M12", "-", [{"code": "X"}, {"code": "P"}]),
+]}]
+
+def test_bls_frame_monthly():
+    df = common.bls_frame(SERIES).sort_values("period_date").reset_index(drop=True)
+    assert df["period"].tolist() == ["M12", "M01", "M02"]  # M13 (annual average) dropped
+    assert df["period_date"].tolist() == [pd.Timestamp("2023-12-01"), pd.Timestamp("2024-01-01"), pd.Timestamp("2024-02-01")]
+    assert df["value"].isna().tolist() == [True, False, False]
+    assert df["footnotes"].tolist() == ["X,P", "", "P"]
+    assert df["preliminary"].tolist() == [True, False, True]
+
+def test_bls_frame_keeps_annual_when_asked():
+    df = common.bls_frame(SERIES, freq=None)
+    annual = df[df["period"] == "M13"].iloc[0]
+    assert annual["freq"] == "A" and annual["period_date"] == pd.Timestamp("2023-01-01")
+    assert len(common.bls_frame([], freq="M")) == 0
+
+def test_merge_incremental_keeps_last():
+    existing = pd.DataFrame({"period_date": pd.to_datetime(["2024-01-01", "2024-02-01"]), "v": [1.0, 1.0]})
+    fresh = pd.DataFrame({"period_date": pd.to_datetime(["2024-02-01", "2024-03-01"]), "v": [2.0, 2.0]})
+    out = common.merge_incremental(existing, fresh, ["period_date"]).sort_values("period_date")
+    assert out["v"].tolist() == [1.0, 2.0, 2.0]
+
+# ---------------- Offline replay ----------------
+
+def test_offline_replays_cache_and_fails_on_miss(monkeypatch, tmp_path):
+    monkeypatch.setattr(common, "BLS_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(common, "_bls_post", lambda *a: pytest.fail("offline run hit the network"))
+    with pytest.raises(RuntimeError, match="offline"):
+        common.bls_request(["LNS14000000"], 2023, 2024, offline=True)
+    common._cache_write(common.bls_cache_key(["LNS14000000"], 2023, 2024), SERIES)
+    assert common.bls_request(["LNS14000000"], 2023, 2024, offline=True) == SERIES
+
+# ---------------- Incremental ----------------
+
+class Down:
+    def connect(self):
+        raise ConnectionError("database unreachable")
+
+@pytest.fixture
+def db_down(monkeypatch, tmp_path):
+    # Store under tmp_path; the DB claims newer rows than the store but cannot be read
+    monkeypatch.setattr(store, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(common, "_db_latest", lambda table: pd.Timestamp("2025-12-01").date())
+    monkeypatch.setattr(common, "get_engine", lambda: Down())
+
+def test_failed_db_read_keeps_stored_history(monkeypatch, db_down):
+    # The run fails instead of saving only the refetched revision window over the history
+    seed = pd.DataFrame({"period_date": pd.date_range("2000-01-01", "2019-12-01", freq="MS"),
+                         "unemployment_rate": 5.0})
+    store.write_dataset(bls_ingest.DATASET, seed)
+    monkeypatch.setattr(bls_ingest, "bls_fetch", lambda *a, **kw: SERIES)
+    with pytest.raises(ConnectionError):
+        bls_ingest.main([])
+    assert len(store.read_dataset(bls_ingest.DATASET)) == len(seed)
+
+def test_catalog_not_overwritten_when_db_unreadable(monkeypatch, tmp_path, db_down):
+    seed = pd.DataFrame({"period_date": pd.Timestamp("2019-12-01"), "series_id": ["A", "B"],
+                         "value": 1.0, "preliminary": False})
+    store.write_dataset(ces_catalog.DATASET, seed)
+    cat = pd.DataFrame({"series_id": ["A", "B"], "begin_year": 2000, "end_year": 2025})
+    fresh = seed.iloc[:1].assign(period_date=pd.Timestamp("2025-12-01"))  # this plan's part only
+    monkeypatch.setattr(ces_catalog, "STATE_PATH", tmp_path / "state.json")
+    monkeypatch.setattr(ces_catalog, "read_catalog", lambda *a, **kw: cat)
+    monkeypatch.setattr(ces_catalog, "run_plan", lambda state, **kw: state)
+    monkeypatch.setattr(ces_catalog, "_collect", lambda: fresh)
+    with pytest.raises(ConnectionError):
+        ces_catalog.main([])
+    assert len(store.read_dataset(ces_catalog.DATASET)) == len(seed)
@@ -0,0 +1,95 @@
+# Offline tests for the equities download: csv_source stands in for yfinance
+import numpy as np
+import pandas as pd
+import pytest
+import store
+import stocks_ingest as si
+
+DAYS = pd.bdate_range("2023-01-02", "2024-06-28")
+
+def write_prices(directory, tickers, scale=1.0):
+    for i, t in enumerate(tickers):
+        close = scale * (50 + 10 * i + np.arange(len(DAYS)) * 0.1)
+        pd.DataFrame({"Date": DAYS, "Close": close}).to_csv(directory / f"{t}.csv", index=False)
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    # Store and batch cache under tmp_path, no database, no waiting between retries
+    for var in ["DATABASE_URL", "PGHOST", "PGPORT", "PGDATABASE", "PGUSER", "PGPASSWORD"]:
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setattr(store, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(si, "BATCHES_DIR", tmp_path / "batches")
+    monkeypatch.setattr(si, "RETRIES", 0)
+    prices = tmp_path / "px"
+    prices.mkdir()
+    return prices
+
+def spy(source, calls):
+    def fetch(tickers, start):
+        calls.append(list(tickers))
+        return source(tickers, start)
+    return fetch
+
+def clear_batches():
+    for p in si.BATCHES_DIR.glob("*.parquet"):
+        p.unlink()
+
+# ---------------- Download ----------------
+
+def test_failed_batch_retried_in_smaller_batches(env):
+    tickers = [f"T{i:02d}" for i in range(12)]
+    write_prices(env, tickers)
+    local, calls = si.csv_source(env), []
+
+    def flaky(tickers, start):
+        # Like a batch download that errors out on one bad symbol
+        calls.append(list(tickers))
+        if "T03" in tickers and len(tickers) > 1:
+            raise ConnectionError("bad symbol in batch")
+        return local([t for t in tickers if t != "T03"], start)
+
+    daily, missing = si.download_daily(tickers, "2023-01-01", flaky, batch_size=10, workers=1)
+    assert missing == ["T03"]
+    assert sorted(map(str, daily["ticker"].unique())) == [t for t in tickers if t != "T03"]
+    assert sorted(map(len, calls)) == [1] * 10 + [2, 10]  # the failed batch of 10, one by one
+    assert ["T03"] in calls
+
+def test_missing_ticker_keeps_stored_rows(env):
+    tickers = ["AAA", "BBB", "CCC"]
+    write_prices(env, tickers)
+    source = si.csv_source(env)
+    df, _ = si.build(tickers=tickers, source=source, daily=True)
+    store.write_dataset(si.DATASET, df)
+    stored = df[df["ticker"] == "CCC"].reset_index(drop=True)
+
+    (env / "CCC.csv").unlink()
+    clear_batches()
+    calls = []
+    df, fetched = si.build(tickers=tickers, source=spy(source, calls), daily=True)
+    assert ["CCC"] in calls  # retried on its own before giving up
+    kept = df[df["ticker"] == "CCC"].reset_index(drop=True)
+    pd.testing.assert_frame_equal(kept, stored, check_categorical=False, check_dtype=False)
+    assert "CCC" not in set(fetched["ticker"].astype(str))
+    assert set(store.read_dataset(si.DAILY_DATASET)["ticker"].astype(str)) == set(tickers)
+
+# ---------------- Incremental ----------------
+
+def test_incremental_sends_restated_ticker_to_full_refresh(env):
+    tickers = ["AAA", "BBB"]
+    write_prices(env, tickers)
+    source = si.csv_source(env)
+    existing, _ = si.build(tickers=tickers, source=source)
+    store.write_dataset(si.DATASET, existing)
+
+    write_prices(env, ["AAA"], scale=0.9)  # e.g. a dividend re-adjusts the whole history
+    clear_batches()
+    new_rows, refresh, daily, failed = si.incremental(existing, tickers, source)
+    assert refresh == ["AAA"] and failed == []
+    assert set(new_rows["ticker"].astype(str)) == {"BBB"}
+    assert set(daily["ticker"].astype(str)) == {"BBB"}
+
+    clear_batches()
+    df, _ = si.build(tickers=tickers, source=source)
+    aaa = df[df["ticker"] == "AAA"].set_index("period_date")["adj_close"]
+    old = existing[existing["ticker"] == "AAA"].set_index("period_date")["adj_close"]
+    np.testing.assert_allclose(aaa.to_numpy(), 0.9 * old.to_numpy())
@@ -0,0 +1,17 @@
+# Parquet store: unchanged frames are not rewritten
+import pandas as pd
+import store
+
+def test_write_dataset_skips_unchanged(monkeypatch, tmp_path):
+    monkeypatch.setattr(store, "DATA_DIR", tmp_path)
+    df = pd.DataFrame({"period_date": pd.to_datetime(["2024-01-31", "2024-02-29"]),
+                       "ticker": pd.Categorical(["AAA", "AAA"]), "adj_close": [1.0, 2.0],
+                       "monthly_return": [None, 1.0]})
+    path = store.write_dataset("equities", df)
+    inode = path.stat().st_ino
+    store.write_dataset("equities", df.assign(ticker=df["ticker"].astype(str)))  # same values
+    assert path.stat().st_ino == inode
+    assert store.content_hash("equities", store.read_dataset("equities")) == store.stored_hash("equities")
+    store.write_dataset("equities", df.assign(adj_close=[1.0, 2.5]))
+    assert path.stat().st_ino != inode
+    assert store.read_dataset("equities")["adj_close"].tolist() == [1.0, 2.5]